@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+'''
+Benchmark code2flow on the testscripts corpus and on scaled up copies of it
+
+Every case runs in its own process so that the peak memory is the case's own.
+Each phase of Mapper.map is timed with code2flowlib.profiler and generateDotFile is timed as 'dot'.
+For each case we record lines/sec, node and edge counts, the time of each phase and the peak RSS.
+
+	python benchmarks/benchmark.py                  run everything and compare with baseline.json
+	python benchmarks/benchmark.py jquery urllib2   run the cases whose name contains one of these
+	python benchmarks/benchmark.py --save           run and store the results as the new baseline
+
+Scaled cases are either one file concatenated several times (x4) or several copies of a file mapped together (*8)
+The first stresses the parser on one big file. The second stresses the multi-file paths (imports, edges between files)
+Generated cases are written from scratch rather than from the testscripts, e.g. a module of 8000 top-level functions
+
+Times depend on the machine so the baseline should be saved on the machine you compare on.
+Node and edge counts don't and any change in them is reported.
+'''
+
+import __builtin__
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,ROOT)
+__builtin__.DEBUG = False
+
+import code2flowlib.dotgenerator as dotgenerator
+import code2flowlib.profiler as profiler
+
+TESTSCRIPTS = os.path.join(ROOT,'testscripts')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),'baseline.json')
+
+#name -> (language,filename,how to scale it,how many times)
+CASES = [
+	('superb-slideshow','js','superb-slideshow.js',None,1),
+	('mootools','js','mootools.js',None,1),
+	('jquery','js','jquery-1.9.1.js',None,1),
+	('urllib2','py','urllib2.py',None,1),
+	('pysimple','py','pysimple.py pysimple2.py pysimple3.py',None,1),
+	('jquery-x4','js','jquery-1.9.1.js','concatenate',4),
+	('mootools*8','js','mootools.js','replicate',8),
+	('urllib2-x8','py','urllib2.py','concatenate',8),
+	('urllib2*32','py','urllib2.py','replicate',32),
+	('urllib2 ast','pyast','urllib2.py',None,1),
+	('urllib2-x8 ast','pyast','urllib2.py','concatenate',8),
+	('urllib2*32 ast','pyast','urllib2.py','replicate',32),
+	('jquery tokens','jstokens','jquery-1.9.1.js',None,1),
+	('jquery-x4 tokens','jstokens','jquery-1.9.1.js','concatenate',4),
+	('mootools*8 tokens','jstokens','mootools.js','replicate',8),
+	('defs-8000','py','defs.py','generate',8000),
+	('defs-8000 ast','pyast','defs.py','generate',8000),
+	]
+
+PHASES = ('read','parseTree','stripComments','generateGroups','trim','generateEdges','dot')
+
+#A phase has to be this many seconds slower, as well as more than the tolerance, to count as a regression
+#Anything quicker than that is mostly noise
+MIN_DIFFERENCE = 0.02
+
+
+def getImplementation(language):
+	if language == 'js':
+		import code2flowlib.languages.javascript as implementation
+	elif language == 'jstokens':
+		import code2flowlib.languages.javascripttokens as implementation
+	elif language == 'pyast':
+		import code2flowlib.languages.pythonast as implementation
+	else:
+		import code2flowlib.languages.python as implementation
+	return implementation
+
+def generateDefs(times):
+	'''
+	A module of 'times' top-level functions which each call another one
+	'''
+	return ''.join('def f%d():\n\tf%d()\n\n'%(i,(i*7+3)%times) for i in xrange(times))
+
+#filename -> how to generate its source for the 'generate' cases
+GENERATORS = {
+	'defs.py':generateDefs,
+	}
+
+def makeFiles(directory,filenames,scale,times):
+	'''
+	Return the files to map for the case, writing scaled copies to directory
+	'''
+	if scale == 'generate':
+		path = os.path.join(directory,filenames)
+		with open(path,'w') as outfile:
+			outfile.write(GENERATORS[filenames](times))
+		return [path]
+
+	paths = [os.path.join(TESTSCRIPTS,filename) for filename in filenames.split()]
+	if not scale:
+		return paths
+
+	ret = []
+	for path in paths:
+		base,extension = os.path.splitext(os.path.basename(path))
+		with open(path) as infile:
+			source = infile.read()
+		if scale == 'concatenate':
+			ret.append(os.path.join(directory,'%s_x%d%s'%(base,times,extension)))
+			with open(ret[-1],'w') as outfile:
+				for i in xrange(times):
+					outfile.write(source+'\n')
+		else:
+			for i in xrange(times):
+				ret.append(os.path.join(directory,'%s_%d%s'%(base,i,extension)))
+				with open(ret[-1],'w') as outfile:
+					outfile.write(source)
+	return ret
+
+def runCase(language,files):
+	'''
+	Map the files once and return the measurements. Runs in the child process
+	'''
+	implementation = getImplementation(language)
+
+	lines = 0
+	for filename in files:
+		with open(filename) as infile:
+			lines += infile.read().count('\n')
+
+	#the mapper prints its progress
+	stdout,sys.stdout = sys.stdout,open(os.devnull,'w')
+	try:
+		profiler.start()
+		mapper = implementation.Mapper(implementation,files)
+		groups,nodes,edges = mapper.map()
+		with profiler.phase('dot'):
+			dotgenerator.generateDotFile(nodes,edges,groups)
+		report = profiler.stop().getReport()
+	finally:
+		sys.stdout = stdout
+
+	phases = dict((name,round(totals['wall'],4)) for name,totals in report['phases'].items() if name in PHASES)
+	total = sum(phases.values())
+	return {
+		'lines':lines,
+		'nodes':len(nodes),
+		'edges':len(edges),
+		'phases':phases,
+		'total':round(total,4),
+		'linesPerSecond':int(lines/total) if total else 0,
+		'peakRSSKB':report['total']['peakRSSKB'],
+		}
+
+def benchmark(language,filenames,scale,times,repeat):
+	'''
+	Run the case 'repeat' times, each in a new process, and keep the fastest time of each phase
+	'''
+	directory = tempfile.mkdtemp(prefix='code2flow-benchmark-')
+	try:
+		files = makeFiles(directory,filenames,scale,times)
+		results = []
+		for i in xrange(repeat):
+			output = subprocess.check_output([sys.executable,os.path.abspath(__file__),'--child',language]+files)
+			results.append(json.loads(output))
+	finally:
+		shutil.rmtree(directory)
+
+	result = results[0]
+	for other in results[1:]:
+		for phase,wall in other['phases'].items():
+			result['phases'][phase] = min(result['phases'].get(phase,wall),wall)
+		result['peakRSSKB'] = min(result['peakRSSKB'],other['peakRSSKB'])
+	result['total'] = round(sum(result['phases'].values()),4)
+	result['linesPerSecond'] = int(result['lines']/result['total']) if result['total'] else 0
+	return result
+
+def compare(name,result,baseline,tolerance):
+	'''
+	Return the regressions of result against the baseline as strings
+	'''
+	regressions = []
+	if baseline['nodes'] != result['nodes'] or baseline['edges'] != result['edges']:
+		regressions.append('%s: %d nodes, %d edges (baseline %d nodes, %d edges)'%(
+			name,result['nodes'],result['edges'],baseline['nodes'],baseline['edges']))
+
+	for phase in ['total']+sorted(result['phases']):
+		now = result['total'] if phase == 'total' else result['phases'][phase]
+		then = baseline['total'] if phase == 'total' else baseline['phases'].get(phase)
+		if then is None or now-then < MIN_DIFFERENCE:
+			continue
+		if now > then*(1+tolerance):
+			regressions.append('%s: %s took %.3fs (baseline %.3fs, %+d%%)'%(name,phase,now,then,100*(now/then-1)))
+	return regressions
+
+def main():
+	cli = argparse.ArgumentParser(description="Benchmark code2flow on the testscripts corpus")
+	cli.add_argument('cases',nargs='*',help='Only run the cases whose name contains one of these')
+	cli.add_argument('--repeat',type=int,default=3,help='Run each case this many times and keep the fastest. Default is %(default)s')
+	cli.add_argument('--baseline',default=DEFAULT_BASELINE,help='Default is benchmarks/baseline.json')
+	cli.add_argument('--save',action='store_true',default=False,help='Store the results as the baseline')
+	cli.add_argument('--tolerance',type=float,default=0.25,help='How much slower than the baseline is a regression. Default is %(default)s')
+	cli.add_argument('--child',nargs='+',help=argparse.SUPPRESS)
+	args = cli.parse_args()
+
+	if args.child:
+		print json.dumps(runCase(args.child[0],args.child[1:]))
+		return 0
+
+	baseline = {}
+	if os.path.isfile(args.baseline):
+		with open(args.baseline) as infile:
+			baseline = json.load(infile)
+
+	results = {}
+	regressions = []
+	print '%-18s %8s %7s %6s %9s %10s %10s'%('case','lines','nodes','edges','time(s)','lines/s','peak(KB)')
+	for name,language,filenames,scale,times in CASES:
+		if args.cases and not any(case in name for case in args.cases):
+			continue
+		result = benchmark(language,filenames,scale,times,args.repeat)
+		results[name] = result
+
+		change = ''
+		if name in baseline:
+			regressions += compare(name,result,baseline[name],args.tolerance)
+			if baseline[name]['total']:
+				change = '%+d%%'%(100*(result['total']/baseline[name]['total']-1))
+		print '%-18s %8d %7d %6d %9.3f %10d %10d %s'%(
+			name,result['lines'],result['nodes'],result['edges'],result['total'],result['linesPerSecond'],result['peakRSSKB'],change)
+
+	if args.save:
+		baseline.update(results)
+		with open(args.baseline,'w') as outfile:
+			json.dump(baseline,outfile,indent=1,sort_keys=True,separators=(',',': '))
+		print "Saved the baseline to %s"%args.baseline
+		return 0
+
+	if regressions:
+		print
+		print "Regressions against %s:"%args.baseline
+		for regression in regressions:
+			print '  '+regression
+		return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,560 @@
+#!/usr/bin/env python
+'''
+Check that code2flow still gives the right answers. benchmark.py says how fast, this says how right
+
+Two kinds of checks:
+	- regression cases: small inputs which once broke a parser
+	- parity checks: several optimizations replaced an algorithm with a faster one which has to give the same answer.
+	  The original algorithm is kept here so that the two can be compared again after any change
+
+	python benchmarks/check.py                    run every check
+	python benchmarks/check.py unterminated block run the checks whose name contains one of these
+	python benchmarks/check.py --random 200000    compare the parsers on more random sources
+
+Prints each check with its failures and exits with 1 if there were any
+'''
+
+import __builtin__
+import argparse
+import contextlib
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,ROOT)
+__builtin__.DEBUG = False
+
+import code2flowlib.engine as engine
+import code2flowlib.ingest as ingest
+import code2flowlib.watch as watch
+import code2flowlib.languages.javascript as javascript
+import code2flowlib.languages.javascripttokens as javascripttokens
+import code2flowlib.languages.python as python
+import code2flowlib.languages.pythonast as pythonast
+from benchmark import generateDefs
+
+TESTSCRIPTS = os.path.join(ROOT,'testscripts')
+
+#implementation -> the testscripts inputs it is checked on. Each list is mapped together
+PARITY_INPUTS = [
+	(javascript,[['simple.js'],['simple2.js'],['superb-slideshow.js'],['mootools.js'],['jquery-1.9.1.js']]),
+	(javascripttokens,[['simple.js'],['simple2.js'],['superb-slideshow.js'],['mootools.js'],['jquery-1.9.1.js']]),
+	(python,[['pysimple.py','pysimple2.py','pysimple3.py'],['urllib2.py']]),
+	(pythonast,[['pysimple.py','pysimple2.py','pysimple3.py'],['urllib2.py']]),
+	]
+
+#How many random sources the parity checks of the parsers compare on. The seed makes every run check the same ones
+RANDOM_SOURCES = 4000
+RANDOM_SEED = 2016
+
+#sources which end in the middle of a literal or comment. Editors save these all the time under --watch
+UNTERMINATED_JS = [
+	'a"',
+	"a'",
+	'a`',
+	'var a = `x${b}',
+	'var a = `x${b}c',
+	'f(); /*',
+	'f(); /* a',
+	'f(); //',
+	'x = /ab',
+	'function a() {',
+	]
+
+#python sources which end right after a colon or in the middle of a block
+UNTERMINATED_PY = [
+	'def a():',
+	'def a():\n',
+	'class B:',
+	'class B:\n\tdef c(self):',
+	'def a():\n\tif b:',
+	'def a(',
+	]
+
+#(smaller,bigger) number of top-level functions to time a module of. Mapping should grow about linearly
+#so bigger/smaller times as much is fine while (bigger/smaller)**2 means something went quadratic again
+SCALING_DEFS = (1000,8000)
+
+#filename -> source of a python project which calls across files through imports
+IMPORTING_PY = {
+	'lib.py':'def y():\n\tpass\n\ndef w():\n\tpass\n\ndef v():\n\tpass\n',
+	'main.py':'''from lib import y as z
+import lib as l
+
+def aliased():
+	z()
+
+def unbound():
+	y()
+
+def viaModule():
+	l.w()
+
+def nested():
+	from lib import v
+	v()
+''',
+	}
+#caller -> callee of every edge between them
+IMPORTING_PY_EDGES = set([('aliased','y'),('viaModule','w'),('nested','v')])
+
+
+def mapFiles(implementation,files):
+	'''
+	Map the files and return (groups,nodes,edges). The mapper's progress is not printed
+	'''
+	return getMapper(implementation,files)[1]
+
+def getMapper(implementation,files):
+	'''
+	Map the files and return (mapper,(groups,nodes,edges)). The mapper's progress is not printed
+	'''
+	stdout,sys.stdout = sys.stdout,open(os.devnull,'w')
+	try:
+		mapper = implementation.Mapper(implementation,files)
+		return mapper,mapper.map()
+	finally:
+		sys.stdout = stdout
+
+def iterParityInputs():
+	'''
+	Yield (implementation,files) for every testscripts input
+	'''
+	for implementation,inputs in PARITY_INPUTS:
+		for files in inputs:
+			yield implementation,[os.path.join(TESTSCRIPTS,filename) for filename in files]
+
+def describe(implementation,files):
+	return '%s on %s'%(implementation.__name__.split('.')[-1],' '.join(map(os.path.basename,files)))
+
+
+@contextlib.contextmanager
+def replacedMethods(cls,methods):
+	'''
+	Run the block with the methods of cls replaced by those in the dict methods
+	'''
+	originals = dict((name,cls.__dict__[name]) for name in methods)
+	for name,method in methods.items():
+		setattr(cls,name,method)
+	try:
+		yield
+	finally:
+		for name,method in originals.items():
+			setattr(cls,name,method)
+
+def getGraph(groups,nodes,edges):
+	'''
+	Everything the output shows about a graph without the UIDs, which depend on what was mapped before
+	'''
+	positions = dict((node,i) for i,node in enumerate(nodes))
+	return ([getGroupTree(group) for group in groups]
+		,[(node.parent.name,node.name,node.lineNumber) for node in nodes]
+		,[(positions.get(node0),positions.get(node1)) for node0,node1 in edges.iterNodes()])
+
+def getGroupTree(group):
+	return (group.name,group.lineNumber,group.definitionString
+		,[(node.name,node.lineNumber) for node in group.nodes]
+		,[getGroupTree(subgroup) for subgroup in group.subgroups])
+
+def parseRandomSource(implementation,source):
+	'''
+	The group tree of source or the name of the exception parsing it raised
+	'''
+	stdout,sys.stdout = sys.stdout,open(os.devnull,'w')
+	try:
+		return getGroupTree(implementation.Mapper(implementation,[]).parseFile('random',source))
+	except Exception as e:
+		return e.__class__.__name__
+	finally:
+		sys.stdout = stdout
+
+def iterRandomSources(tokens):
+	'''
+	Yield RANDOM_SOURCES strings of up to 60 of the tokens
+	'''
+	generator = random.Random(RANDOM_SEED)
+	for i in xrange(RANDOM_SOURCES):
+		yield ''.join(generator.choice(tokens) for j in xrange(generator.randint(1,60)))
+
+def compareParsers(implementation,cls,methods,tokens):
+	'''
+	Parse the testscripts inputs of implementation and random sources of the tokens as they are
+	and with the methods of cls replaced by those in the dict methods. Return the failures
+	'''
+	failures = []
+	for parityImplementation,files in iterParityInputs():
+		if parityImplementation is implementation:
+			graph = getGraph(*mapFiles(implementation,files))
+			with replacedMethods(cls,methods):
+				originalGraph = getGraph(*mapFiles(implementation,files))
+			if graph != originalGraph:
+				failures.append('%s: the graph is different'%describe(implementation,files))
+
+	for source in iterRandomSources(tokens):
+		tree = parseRandomSource(implementation,source)
+		with replacedMethods(cls,methods):
+			originalTree = parseRandomSource(implementation,source)
+		if tree != originalTree:
+			failures.append('%s on %r: %r, originally %r'%(implementation.__name__,source,tree,originalTree))
+	return failures
+
+
+def generateEdgesFromEveryPair(nodes):
+	'''
+	engine.generateEdges before the call-site index (user-001): ask every node whether it links to every other node
+	'''
+	edges = []
+	for node0 in nodes:
+		for node1 in nodes:
+			if node0.linksTo(node1):
+				edges.append((node0,node1))
+	return edges
+
+def checkCallSiteIndex():
+	'''
+	The call-site index finds the same edges, in the same order, as checking every pair of nodes
+	'''
+	failures = []
+	for implementation,files in iterParityInputs():
+		mapper,_ = getMapper(implementation,files)
+		nodes = mapper._getNodes()
+		expected = generateEdgesFromEveryPair(nodes)
+		found = list(engine.generateEdges(nodes,implementation.Edge).iterNodes())
+		if found != expected:
+			failures.append('%s: %d edges from the index, %d from every pair'%(describe(implementation,files),len(found),len(expected)))
+	return failures
+
+#what the random sources for the token front end's linksTo are made of
+#The blocks are fenced with ';' because a name and a paren which only meet once a block is cut out are no call to the tokenizer
+CALL_TOKENS = [
+	';function a() {',';function b(c) {',';var d = function() {',';e.f = function() {','};','};','\n',' ',';'
+	,'a','b','d','f','_a','$a','e.','this.','window.','window.e.','(',')','()','/* a( */','"b("','`${f()}`','// d(\n',
+	]
+
+def parseRandomNodes(implementation,source):
+	'''
+	The nodes of source or None if parsing it raised
+	'''
+	stdout,sys.stdout = sys.stdout,open(os.devnull,'w')
+	try:
+		return implementation.Mapper(implementation,[]).parseFile('random',source)._allNodes()
+	except Exception:
+		return None
+	finally:
+		sys.stdout = stdout
+
+def checkTokenCalls():
+	'''
+	javascripttokens.Node.linksTo, which only searches in front of the calls, links the same pairs as javascript.Node.linksTo
+	'''
+	originalLinksTo = javascript.Node.__dict__['linksTo']
+	failures = []
+	for implementation,files in iterParityInputs():
+		if implementation is javascripttokens:
+			nodes = mapFiles(implementation,files)[1]
+			expected = [(node0,node1) for node0 in nodes for node1 in nodes if originalLinksTo(node0,node1)]
+			if generateEdgesFromEveryPair(nodes) != expected:
+				failures.append('%s: different edges'%describe(implementation,files))
+
+	for source in iterRandomSources(CALL_TOKENS):
+		nodes = parseRandomNodes(javascripttokens,source)
+		for node0 in nodes or ():
+			for node1 in nodes:
+				if node0.linksTo(node1) != originalLinksTo(node0,node1):
+					failures.append('%r: %s links to %s %s'%(source,node0.name,node1.name,originalLinksTo(node0,node1)))
+	return failures
+
+def checkUnterminatedJS():
+	'''
+	Every javascript parser maps a file cut off inside of a literal or comment
+	'''
+	failures = []
+	directory = tempfile.mkdtemp(prefix='code2flow-check-')
+	try:
+		for i,source in enumerate(UNTERMINATED_JS):
+			filename = os.path.join(directory,'unterminated%d.js'%i)
+			with open(filename,'w') as outfile:
+				outfile.write(source)
+			for implementation in (javascript,javascripttokens):
+				try:
+					mapFiles(implementation,[filename])
+				except Exception as e:
+					failures.append('%s on %r: %s: %s'%(implementation.__name__,source,e.__class__.__name__,e))
+	finally:
+		shutil.rmtree(directory)
+	return failures
+
+def checkUnterminatedPython():
+	'''
+	Every python parser which reads text (not the ast one) maps a file cut off after a colon
+	'''
+	failures = []
+	directory = tempfile.mkdtemp(prefix='code2flow-check-')
+	try:
+		for i,source in enumerate(UNTERMINATED_PY):
+			filename = os.path.join(directory,'unterminated%d.py'%i)
+			with open(filename,'w') as outfile:
+				outfile.write(source)
+			try:
+				mapFiles(python,[filename])
+			except Exception as e:
+				failures.append('%s on %r: %s: %s'%(python.__name__,source,e.__class__.__name__,e))
+	finally:
+		shutil.rmtree(directory)
+	return failures
+
+def checkWatchedFiles():
+	'''
+	Watch mode picks up new files in any walked directory, including ones created later
+	, and judges them by the same rules as the walk
+	'''
+	failures = []
+	directory = tempfile.mkdtemp(prefix='code2flow-check-')
+	try:
+		def write(path,content='#'):
+			path = os.path.join(directory,path)
+			if not os.path.isdir(os.path.dirname(path)):
+				os.makedirs(os.path.dirname(path))
+			with open(path,'w') as outfile:
+				outfile.write(content)
+
+		write('src/a.py')
+		write('src/sub/b.py')
+		write('src/.gitignore','skip_*\n')
+		filters = {'include':['src/**'],'exclude':[],'maxSize':1000,'gitignore':True}
+		sourceDirectory = ingest.SourceDirectory(directory,['py'],**filters)
+		watcher = watch.PollingWatcher(list(sourceDirectory.iterFiles()),[sourceDirectory],0,0.01)
+
+		#path -> whether it should be reported
+		cases = [
+			('src/sub/new.py',True),
+			('src/later/deeper/new.py',True),
+			('src/sub/skip_me.py',False),
+			('src/big.py',False),
+			('lib/new.py',False),
+			('new.js',False),
+			]
+		for path,expected in cases:
+			write(path,'#'*(5000 if 'big' in path else 10))
+			changed = watcher._waitForChanges(0.1) or set()
+			reported = os.path.join(directory,path) in changed
+			if reported != expected:
+				failures.append('%s was %sreported'%(path,'' if reported else 'not '))
+		watcher.close()
+	finally:
+		shutil.rmtree(directory)
+	return failures
+
+def checkPythonImports():
+	'''
+	Every python parser links calls through import aliases, and only through the names a file imports
+	'''
+	failures = []
+	directory = tempfile.mkdtemp(prefix='code2flow-check-')
+	try:
+		filenames = []
+		for filename,source in sorted(IMPORTING_PY.items()):
+			filenames.append(os.path.join(directory,filename))
+			with open(filenames[-1],'w') as outfile:
+				outfile.write(source)
+		for implementation in (python,pythonast):
+			groups,nodes,edges = mapFiles(implementation,filenames)
+			found = set((edge.node0.name,edge.node1.name) for edge in edges)
+			for caller,callee in sorted(found-IMPORTING_PY_EDGES):
+				failures.append('%s links %s to %s'%(implementation.__name__,caller,callee))
+			for caller,callee in sorted(IMPORTING_PY_EDGES-found):
+				failures.append('%s does not link %s to %s'%(implementation.__name__,caller,callee))
+	finally:
+		shutil.rmtree(directory)
+	return failures
+
+#javascript.Group.PATTERNS before they were bounded (user-022). Each is matched on the source between the last '}' and the block
+UNBOUNDED_BLOCK_PATTERNS = [
+	{'type':'function','pattern':re.compile(r".*?\W(function\s+(\w+)\s*\(.*?\)\s*\Z)",re.DOTALL)}
+	,{'type':'function','pattern':re.compile(r".*?[^a-zA-Z0-9_\.]+(([\w\.]+)\s*[\:\=]\s*function\s*\(.*?\)\s*\Z)",re.DOTALL)}
+	,{'type':'object','pattern':re.compile(r".*?\W(([\w\.]+)\s*\=\s*\Z)",re.DOTALL)}
+	,{'type':'anonFunction','pattern':re.compile(r".*?\(\s*(function\s*\(.*?\)\s*\Z)",re.DOTALL)}
+	]
+
+#what the random sources for the block patterns are made of
+BLOCK_TOKENS = [
+	'function','function ','function(','function a(','= function(',': function (','(function(','( function(','new ','var ','return ','if (a) '
+	,'a','b.c','this.d','$',' ','\n','\t','=',' = ',':','(',' (',')','()','(a, b)','{','{','}','}',',',';','.','1',
+	]
+
+def newGroupFromBlockWithUnboundedPatterns(self,openBracket,closeBracket):
+	'''
+	javascript.Group.newGroupFromBlock with the UNBOUNDED_BLOCK_PATTERNS
+	'''
+	preBlockSource = self.source[:openBracket]
+	blockSource = self.source[openBracket:closeBracket+1]
+
+	lastBracket = preBlockSource.rfind('}')
+	if lastBracket == -1:
+		lastBracket = 0
+
+	for pattern in UNBOUNDED_BLOCK_PATTERNS:
+		match = pattern['pattern'].match(preBlockSource[lastBracket:].sourceString)
+		if match:
+			name = "(anon)" if pattern['type'] == 'anonFunction' else match.group(2)
+			return self.newGroupFromDefinition(preBlockSource,blockSource,pattern['type'],name,lastBracket+match.start(1))
+	return None
+
+def checkBlockPatterns():
+	'''
+	The bounded block patterns of javascript.py find the same definitions as the unbounded ones they replaced
+	'''
+	return compareParsers(javascript,javascript.Group,{'newGroupFromBlock':newGroupFromBlockWithUnboundedPatterns},BLOCK_TOKENS)
+
+#what the random sources for python blocks are made of
+INDENT_TOKENS = [
+	'\n','\n','\n','\t','\t',' ','    ','\r','\x0c','def a():','def b(c):','class D:','class E(D):','if a:','else:',':','\\\n'
+	,'pass','a()','b(1)','self.a()','D()','x = D()','x.a()','return','#',
+	]
+
+def getIndentByLines(self,colonPos):
+	'''
+	python.SourceCode.getIndent before the indent table (user-023)
+	'''
+	return python.getIndent(colonPos,self.sourceString)
+
+def getBlockEndByLines(self,colonPos):
+	'''
+	python.SourceCode._getBlockEnd before the indent table (user-023): split the rest of the source into lines
+	and walk them until one is not in the block
+	'''
+	indent = python.getIndent(colonPos,self.sourceString)
+
+	endPos = colonPos
+
+	lines = self.sourceString[colonPos:].split('\n')[1:]
+	for line in lines:
+		if line.startswith(indent) or line.strip()=='':
+			endPos += len(line)+1 #+1 for the newlines lost
+		else:
+			break
+	return endPos
+
+def checkPythonBlocks():
+	'''
+	The indent table of python.py finds the same blocks as walking the lines did
+	'''
+	methods = {'getIndent':getIndentByLines,'_getBlockEnd':getBlockEndByLines}
+	return compareParsers(python,python.SourceCode,methods,INDENT_TOKENS)
+
+def checkPythonScaling():
+	'''
+	Mapping a module with many top-level functions takes about linear time in every python parser
+	'''
+	failures = []
+	smaller,bigger = SCALING_DEFS
+	directory = tempfile.mkdtemp(prefix='code2flow-check-')
+	try:
+		for implementation in (python,pythonast):
+			times = []
+			for count in SCALING_DEFS:
+				filename = os.path.join(directory,'defs%d.py'%count)
+				with open(filename,'w') as outfile:
+					outfile.write(generateDefs(count))
+				#the best of two runs so that a hiccup on the small one doesn't fail the check
+				durations = []
+				for i in xrange(2):
+					start = time.time()
+					mapFiles(implementation,[filename])
+					durations.append(time.time()-start)
+				times.append(min(durations))
+
+			#halfway between linear and quadratic on a log scale
+			limit = (bigger/float(smaller))**1.5
+			if times[1] > times[0]*limit:
+				failures.append('%s took %.2fs for %d functions and %.2fs for %d (over %dx)'%(
+					implementation.__name__,times[0],smaller,times[1],bigger,limit))
+	finally:
+		shutil.rmtree(directory)
+	return failures
+
+def checkUpdateOrder():
+	'''
+	Mapper.update gives the same graph, in the same order, as mapping the files again from scratch
+	Changed files keep their place and added files go where the order passed to update puts them
+	'''
+	failures = []
+	directory = tempfile.mkdtemp(prefix='code2flow-check-')
+	try:
+		def write(name,source):
+			with open(os.path.join(directory,name),'w') as outfile:
+				outfile.write(source)
+		def paths(names):
+			return [os.path.join(directory,name) for name in names]
+
+		for name in ('zeta','alpha','mid','omega'):
+			write(name+'.py','def %s():\n\tpass\n'%name)
+
+		for implementation in (python,pythonast):
+			names = ['zeta','alpha','mid']
+			mapper,_ = getMapper(implementation,paths(name+'.py' for name in names))
+
+			#name of the step -> (what to do,the changed file,the files a fresh map would be passed,whether to pass the order)
+			steps = [
+				('change',lambda: write('alpha.py','def alpha():\n\tmid()\n'),'alpha.py',['zeta','alpha','mid'],False),
+				('add',lambda: write('beta.py','def beta():\n\tzeta()\n'),'beta.py',['zeta','beta','alpha','mid'],True),
+				('remove',lambda: os.remove(os.path.join(directory,'zeta.py')),'zeta.py',['beta','alpha','mid'],False),
+				]
+			for step,edit,changed,names,passOrder in steps:
+				edit()
+				files = paths(name+'.py' for name in names)
+				stdout,sys.stdout = sys.stdout,open(os.devnull,'w')
+				try:
+					updated = getGraph(*mapper.update(paths([changed]),files if passOrder else None))
+				finally:
+					sys.stdout = stdout
+				if updated != getGraph(*mapFiles(implementation,files)):
+					failures.append('%s: the graph after the %s is not that of a fresh map'%(implementation.__name__,step))
+			write('zeta.py','def zeta():\n\tpass\n')
+			write('alpha.py','def alpha():\n\tpass\n')
+			os.remove(os.path.join(directory,'beta.py'))
+	finally:
+		shutil.rmtree(directory)
+	return failures
+
+#name -> check. Each check returns a list of failures
+CHECKS = [
+	('unterminated js',checkUnterminatedJS),
+	('unterminated python',checkUnterminatedPython),
+	('watched files',checkWatchedFiles),
+	('python imports',checkPythonImports),
+	('python scaling',checkPythonScaling),
+	('update order',checkUpdateOrder),
+	('call site index',checkCallSiteIndex),
+	('js token calls',checkTokenCalls),
+	('js block patterns',checkBlockPatterns),
+	('python blocks',checkPythonBlocks),
+	]
+
+
+def main():
+	global RANDOM_SOURCES
+	cli = argparse.ArgumentParser(description="Check code2flow's output on regression cases and against the algorithms it replaced")
+	cli.add_argument('checks',nargs='*',help='Only run the checks whose name contains one of these')
+	cli.add_argument('--random',type=int,default=RANDOM_SOURCES,help='How many random sources to compare the parsers on (default %d)'%RANDOM_SOURCES)
+	args = cli.parse_args()
+	RANDOM_SOURCES = args.random
+
+	failed = False
+	for name,check in CHECKS:
+		if args.checks and not any(pattern in name for pattern in args.checks):
+			continue
+		failures = check()
+		print '%-24s %s'%(name,'FAILED' if failures else 'ok')
+		for failure in failures:
+			print '  '+failure
+		failed = failed or bool(failures)
+	return 1 if failed else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,116 @@
+'''
+The bracket index behind SourceCode.matchingBracketPos and SourceCode.openDelimPos
+'''
+
+from array import array
+from bisect import bisect_left,bisect_right
+import re
+
+
+class BracketTable(object):
+	'''
+	Every opening bracket of a buffer paired with its closing bracket. Built in one pass with a stack
+
+	Four arrays:
+		opens: sorted positions of the opening brackets
+		closes: the position of the closing bracket of each of those or -1 if it is never closed
+		parents: the innermost opening bracket around each of those as an index into opens or -1
+		strays: sorted positions of the closing brackets which close nothing
+
+	Any of openChars pairs with any of closeChars
+
+	Without a buffer, the table starts empty and whoever already knows where the brackets are (e.g. a tokenizer)
+	adds them in order with open and close
+	'''
+
+	__slots__ = ('opens','closes','parents','strays','stack')
+
+	def __init__(self,buffer=None,openChars='',closeChars=''):
+		self.opens = array('i')
+		self.closes = array('i')
+		self.parents = array('i')
+		self.strays = array('i')
+		self.stack = []
+
+		if buffer is not None:
+			for match in re.finditer('[%s]'%re.escape(openChars+closeChars),buffer):
+				if match.group() in openChars:
+					self.open(match.start())
+				else:
+					self.close(match.start())
+
+	def open(self,pos):
+		self.parents.append(self.stack[-1] if self.stack else -1)
+		self.stack.append(len(self.opens))
+		self.opens.append(pos)
+		self.closes.append(-1)
+
+	def close(self,pos):
+		if self.stack:
+			self.closes[self.stack.pop()] = pos
+		else:
+			self.strays.append(pos)
+
+	def closeAfter(self,pos):
+		'''
+		The closing bracket of the block which pos is in
+		The same as scanning forward from pos, counting brackets, until there is one more closing bracket than opening ones
+		-1 if there is none
+		'''
+		i = bisect_left(self.opens,pos)-1
+		while i != -1 and self.closes[i] != -1 and self.closes[i] < pos:
+			i = self.parents[i]
+		if i != -1:
+			return self.closes[i]
+
+		#no block is open here so the first stray closing bracket ends it
+		i = bisect_left(self.strays,pos)
+		if i < len(self.strays):
+			return self.strays[i]
+		return -1
+
+	def openBefore(self,pos):
+		'''
+		The opening bracket of the block which pos is in, counting pos itself
+		The same as scanning back from pos, counting brackets, until there is one more opening bracket than closing ones
+		-1 if there is none
+		'''
+		i = bisect_right(self.opens,pos)-1
+		while i != -1 and self.closes[i] != -1 and self.closes[i] <= pos:
+			i = self.parents[i]
+		if i != -1:
+			return self.opens[i]
+		return -1
+
+
+class BracketIndex(object):
+	'''
+	The bracket tables of one buffer, each built the first time it is asked for
+	Like the LineIndex, one BracketIndex is shared by every slice of a file
+	'''
+
+	__slots__ = ('tables',)
+
+	def __init__(self):
+		self.tables = {}
+
+	def __getstate__(self):
+		'''
+		The tables are only needed while parsing. Don't pickle them with the file group
+		'''
+		return {'tables':{}}
+
+	def __setstate__(self,state):
+		self.tables = state['tables']
+
+	def setTable(self,openChars,closeChars,table):
+		self.tables[(openChars,closeChars)] = table
+
+	def getTable(self,buffer,openChars,closeChars):
+		key = (openChars,closeChars)
+		try:
+			return self.tables[key]
+		except KeyError:
+			pass
+		table = self.tables[key] = BracketTable(buffer,openChars,closeChars)
+		return table
@@ -0,0 +1,163 @@
+'''
+On-disk caches of parsed files and of rendered images
+
+Parsing a file (Mapper.parseFile) is the expensive part of mapping it and the result only depends on
+the language, the filename, the contents of the file and the version of the engine.
+So, the parsed file group (cleaned sourcecode, line index, subgroups, nodes and their call sites) is pickled
+to a file named by a hash of those. Re-running on a tree where one file changed only parses that file.
+
+Rendered images only depend on the DOT file so they are kept by a hash of it. See render.py
+
+Each cache is bounded in size. Entries are touched when they are used and the least recently used are evicted first.
+'''
+
+import cPickle
+import hashlib
+import os
+import shutil
+import tempfile
+
+#Bump this whenever the parsed groups/nodes change so that old entries are never loaded
+CACHE_VERSION = 8
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'),'.cache','code2flow')
+DEFAULT_MAX_SIZE = 256*1024*1024
+
+
+class DiskCache(object):
+	'''
+	A directory of entries which is kept under maxSize. Subclassed by ParseCache and RenderCache
+	'''
+
+	#each kind of cache gets its own directory inside of the cache directory
+	subdirectory = None
+
+	def __init__(self,directory=DEFAULT_CACHE_DIR,maxSize=DEFAULT_MAX_SIZE):
+		self.directory = os.path.join(directory,self.subdirectory)
+		self.maxSize = maxSize
+
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+
+	def evict(self):
+		'''
+		Remove the least recently used entries until the cache fits in maxSize
+		'''
+		entries = []
+		totalSize = 0
+		for name in os.listdir(self.directory):
+			path = os.path.join(self.directory,name)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			entries.append((stat.st_mtime,stat.st_size,path))
+			totalSize += stat.st_size
+
+		entries.sort()
+		for mtime,size,path in entries:
+			if totalSize <= self.maxSize:
+				break
+			self._remove(path)
+			totalSize -= size
+
+	def _touch(self,path):
+		'''
+		Mark as recently used
+		'''
+		try:
+			os.utime(path,None)
+		except OSError:
+			pass
+
+	def _write(self,path,write):
+		'''
+		Call write(outfile) on a temporary file and move it into place so that a concurrent run never reads half an entry
+		'''
+		fd,tmpPath = tempfile.mkstemp(dir=self.directory,suffix='.tmp')
+		try:
+			with os.fdopen(fd,'wb') as outfile:
+				write(outfile)
+			os.rename(tmpPath,path)
+		except Exception:
+			self._remove(tmpPath)
+			raise
+
+	def _remove(self,path):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+
+
+class ParseCache(DiskCache):
+	'''
+	Cache of (fileGroup,uidCount) results keyed by getKey
+	'''
+
+	subdirectory = 'parse'
+
+	def getKey(self,implementationName,filename,fileString):
+		'''
+		The filename is part of the key because the file group is named after it
+		'''
+		hasher = hashlib.sha1()
+		for part in (str(CACHE_VERSION),implementationName,filename,fileString):
+			hasher.update(part)
+			hasher.update('\0')
+		return hasher.hexdigest()
+
+	def get(self,key):
+		'''
+		Return the cached result or None
+		'''
+		path = self._getPath(key)
+		try:
+			with open(path,'rb') as infile:
+				ret = cPickle.load(infile)
+		except IOError:
+			return None
+		except Exception:
+			#A truncated or otherwise unreadable entry is a miss. Remove it so it is rewritten
+			self._remove(path)
+			return None
+
+		self._touch(path)
+		return ret
+
+	def put(self,key,value):
+		self._write(self._getPath(key),lambda outfile: cPickle.dump(value,outfile,cPickle.HIGHEST_PROTOCOL))
+
+	def _getPath(self,key):
+		return os.path.join(self.directory,key+'.pickle')
+
+
+class RenderCache(DiskCache):
+	'''
+	Cache of rendered images keyed by a hash of the DOT file (see render.Renderer) and the image format
+	'''
+
+	subdirectory = 'render'
+
+	def get(self,key,fmt,filename):
+		'''
+		Copy the cached image to filename. Returns whether it was cached
+		'''
+		path = self._getPath(key,fmt)
+		try:
+			shutil.copyfile(path,filename)
+		except IOError:
+			return False
+
+		self._touch(path)
+		return True
+
+	def put(self,key,fmt,filename):
+		'''
+		Add the image which was just rendered to filename
+		'''
+		with open(filename,'rb') as infile:
+			self._write(self._getPath(key,fmt),lambda outfile: shutil.copyfileobj(infile,outfile))
+
+	def _getPath(self,key,fmt):
+		return os.path.join(self.directory,key+'.'+fmt)
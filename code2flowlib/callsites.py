@@ -0,0 +1,119 @@
+'''
+The call-site index used by engine.generateEdges
+
+Without it, every node is asked whether it links to every other node which means n^2 calls to linksTo
+, each of which runs several regexes over the caller's entire source.
+
+Instead, the source of each node is tokenized once into the set of identifiers which appear right before an open paren.
+That covers every way a function can be called: name(), a.b.name(), self.name(), new X(), etc.
+Every linksTo implementation ends its search pattern with the name of the callee followed by "\s*\("
+, so a caller can only link to a callee if one of its call-site identifiers ends with one of the callee's names.
+Those names are looked up in a dict and the full linksTo is only run on the candidate pairs that come out of it.
+'''
+
+from bisect import bisect_left
+import re
+
+callSitePattern = re.compile(r"(\w+)\s*\(")
+identifierPattern = re.compile(r"\w+\Z")
+
+
+def getCallSites(sourceString,start=0,stop=None):
+	'''
+	Return the set of identifiers which are immediately followed by an open paren in sourceString[start:stop]
+	'''
+	if stop is None:
+		stop = len(sourceString)
+	return frozenset(callSitePattern.findall(sourceString,start,stop))
+
+
+class CallSiteIndex(object):
+	'''
+	Maps the names a node can be called by to the node and the identifiers a node calls to the node
+	The first answers "what might this node call" (candidates) and the second "what might call this node" (callers)
+
+	Nodes with a name which is not a plain identifier (e.g. the implicit "(file module frame (runs on import))" nodes)
+	can't be looked up this way so they are treated as candidates for every caller
+	'''
+
+	def __init__(self,nodes=()):
+		self.nodes = set()
+		self.calleesByName = {}
+		self.wildcards = set()
+		self.callersByCallSite = {}
+		self._reversedCallSites = None
+		self.add(nodes)
+
+	def add(self,nodes):
+		for node in nodes:
+			self.nodes.add(node)
+
+			names = node.getCallSiteNames()
+			if all(map(identifierPattern.match,names)):
+				for name in names:
+					self.calleesByName.setdefault(name,set()).add(node)
+			else:
+				self.wildcards.add(node)
+
+			for callSite in node.callSites:
+				if callSite not in self.callersByCallSite:
+					self.callersByCallSite[callSite] = set()
+					self._reversedCallSites = None
+				self.callersByCallSite[callSite].add(node)
+
+	def remove(self,nodes):
+		for node in nodes:
+			self.nodes.discard(node)
+			self.wildcards.discard(node)
+			for name in node.getCallSiteNames():
+				self._discard(self.calleesByName,name,node)
+			for callSite in node.callSites:
+				if self._discard(self.callersByCallSite,callSite,node):
+					self._reversedCallSites = None
+
+	def candidates(self,caller):
+		'''
+		Return the set of nodes which the caller might link to
+		Call sites can link to any name they end with (e.g. "_name(" matches the javascript pattern for "name(")
+		'''
+		ret = set(self.wildcards)
+		for callSite in caller.callSites:
+			for i in xrange(len(callSite)):
+				callees = self.calleesByName.get(callSite[i:])
+				if callees:
+					ret |= callees
+		return ret
+
+	def callers(self,callee):
+		'''
+		Return the set of nodes which might link to the callee. The reverse of candidates
+		'''
+		names = callee.getCallSiteNames()
+		if not all(map(identifierPattern.match,names)):
+			return set(self.nodes)
+
+		#Call sites ending with the name are found by looking for the reversed name in the sorted reversed call sites
+		if self._reversedCallSites is None:
+			self._reversedCallSites = sorted(callSite[::-1] for callSite in self.callersByCallSite)
+
+		ret = set()
+		for name in names:
+			reversedName = name[::-1]
+			i = bisect_left(self._reversedCallSites,reversedName)
+			while i < len(self._reversedCallSites) and self._reversedCallSites[i].startswith(reversedName):
+				ret |= self.callersByCallSite[self._reversedCallSites[i][::-1]]
+				i += 1
+		return ret
+
+	def _discard(self,index,key,node):
+		'''
+		Remove node from index[key], dropping the key once nothing is left under it
+		Returns whether the key was dropped
+		'''
+		nodes = index.get(key)
+		if nodes:
+			nodes.discard(node)
+			if not nodes:
+				del index[key]
+				return True
+		return False
@@ -1,45 +1,58 @@
+LEGEND = """
+			subgraph legend{
+			rank = min;
+			label = "legend";
+			Legend [shape=none, margin=0, label = <
+				<table cellspacing="0" cellpadding="0" border="1"><tr><td>Code2flow Legend</td></tr><tr><td>
+				<table cellspacing="0">
+				<tr><td>Regular function</td><td width="50px"></td></tr>
+				<tr><td>Trunk function (nothing calls this)</td><td bgcolor='coral'></td></tr>
+				<tr><td>Leaf function (this calls nothing else)</td><td bgcolor='green'></td></tr>
+				<tr><td>Function call which returns no value</td><td>&#8594;</td></tr>
+				<tr><td>Function call returns some value</td><td><font color='blue'>&#8594;</font></td></tr>
+				</table></td></tr></table>
+				>];}"""
+
 def writeDotFile(dotFile,nodes,edges,groups,hidelegend=False):
 	'''
 	Write the dot file
 	'''
 	with open(dotFile,'w') as outfile:
-		outfile.write(generateDotFile(nodes,edges,groups,hidelegend))
+		writeDot(outfile,nodes,edges,groups,hidelegend)
+
+def writeDot(outfile,nodes,edges,groups,hidelegend=False):
+	'''
+	Write the dotfile to any writable stream, a piece at a time, so that it never has to be held in memory
+	'''
+	outfile.writelines(iterDotFile(nodes,edges,groups,hidelegend))
 
 def generateDotFile(nodes,edges,groups,hidelegend=False):
 	'''
 	Return the string for the entire dotfile
-	To be appended:
+	'''
+	return ''.join(iterDotFile(nodes,edges,groups,hidelegend))
+
+def iterDotFile(nodes,edges,groups,hidelegend=False):
+	'''
+	Yield the pieces of the dotfile in order:
 	- A legend
 	- Nodes
 	- Edges
 	- Groups
 	'''
-	ret = "digraph G {\n"
-	ret +="concentrate = true;"
+	yield "digraph G {\n"
+	yield "concentrate = true;"
 	if not hidelegend:
-		ret += """
-			subgraph legend{
-			rank = min;
-			label = "legend";
-			Legend [shape=none, margin=0, label = <
-				<table cellspacing="0" cellpadding="0" border="1"><tr><td>Code2flow Legend</td></tr><tr><td>
-				<table cellspacing="0">
-				<tr><td>Regular function</td><td width="50px"></td></tr>
-				<tr><td>Trunk function (nothing calls this)</td><td bgcolor='coral'></td></tr>
-				<tr><td>Leaf function (this calls nothing else)</td><td bgcolor='green'></td></tr>
-				<tr><td>Function call which returns no value</td><td>&#8594;</td></tr>
-				<tr><td>Function call returns some value</td><td><font color='blue'>&#8594;</font></td></tr>
-				</table></td></tr></table>
-				>];}"""
+		yield LEGEND
 	for node in nodes:
-		if str(node):
-			ret += str(node)+';\n'
+		nodeString = str(node)
+		if nodeString:
+			yield nodeString+';\n'
 	for edge in edges:
-		ret += str(edge)+';\n'
-	#if False:
+		yield str(edge)+';\n'
 	for group in groups:
-		ret += str(group)+';\n'
-
-	ret += '}'
+		for fragment in group._iterDot():
+			yield fragment
+		yield ';\n'
 
-	return ret
\ No newline at end of file
+	yield '}'
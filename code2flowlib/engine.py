@@ -17,43 +17,132 @@ This way, we can share a lot of code between languages while still preserving fu
 Functions that begin with an "_" are not replaced by any implementation
 '''
 
+from array import array
+from collections import OrderedDict
 import copy
 import importlib
+import itertools
+import mmap
+import multiprocessing
 import operator
 import os
 import re
 import pdb
 import pprint
 
+from bracketindex import BracketIndex
+from callsites import CallSiteIndex,getCallSites
+from lineindex import LineIndex
 from mutablestring import MString
+from patterns import PatternFactory
+import profiler
 
 #for generating UIDs for groups and nodes
 currentUID = 0
 
-def generateEdges(nodes):
+#Files at least this big are memory mapped rather than read into a string (see readSource)
+MMAP_MIN_SIZE = 1024*1024
+
+#How nodes are called. Implementations extend this with their own kinds
+patterns = PatternFactory({
+	'name':(r"(?:\W|\A)(%(name)s)\s*\(",re.MULTILINE),
+	'sameScope':(r"(?:\W|\A)%(namespace)s\.%(name)s\s*\(",re.MULTILINE|re.DOTALL),
+	'anyScope':(r"(?:[^a-zA-Z0-9\.]|\A)%(fullName)s\s*\(",re.MULTILINE|re.DOTALL),
+	})
+
+def generateEdges(nodes,edgeClass=None,callSiteIndex=None):
 	'''
 	When a function calls another function, that is an edge
 	This is in the global scope because edges can exist between any node and not just between groups
+
+	Only the pairs which the call-site index says might link are checked with linksTo
+	Candidates are checked in the order of 'nodes' so that edges come out in the same order as checking every pair would
 	'''
-	edges = []
+	callSiteIndex = callSiteIndex or CallSiteIndex(nodes)
+	positions = dict((node,i) for i,node in enumerate(nodes))
+
+	edges = EdgeList(edgeClass)
 	for node0 in nodes:
-		for node1 in nodes:
+		for node1 in sorted(callSiteIndex.candidates(node0),key=positions.get):
 			if DEBUG:
 				print '"%s" links to "%s"?'%(node0.name,node1.name)
 			if node0.linksTo(node1):
 				if DEBUG:
 					print "Edge created"
-				edges.append(Edge(node0,node1))
+				edges.append(node0,node1)
 	return edges
 
+
+def readSource(filename):
+	'''
+	Return the text of a file for SourceCode to scan. Small files are read into a string
+	Big ones (e.g. generated bundles) are memory mapped so the file is paged in as it is scanned rather than copied into the process
+	Either way, only the cleaned source (see SourceCode._removeCommentsAndStrings) is kept
+	'''
+	with open(filename) as fi:
+		size = os.fstat(fi.fileno()).st_size
+		if size < MMAP_MIN_SIZE:
+			return fi.read()
+		#the mmap keeps its own handle to the file and is closed when it is no longer referenced
+		return mmap.mmap(fi.fileno(),size,access=mmap.ACCESS_READ)
+
+def _parseFile(task):
+	'''
+	Read one file and generate its file group, or load it from the cache (see cache.py)
+	This runs in a worker process when mapping with jobs > 1 so that reading, caching and parsing all happen in parallel
+
+	UIDs are numbered from 0 for every file and the number used is returned alongside the group
+	That way, the Mapper can shift them into place no matter which process parsed the file
+	Returns (filename,(fileGroup,uidCount))
+	'''
+	global currentUID
+	implementationName,filename,cache = task
+	implementation = importlib.import_module(implementationName)
+
+	with profiler.phase('read',filename):
+		fileString = readSource(filename)
+
+	if cache:
+		with profiler.phase('cacheLoad',filename):
+			cacheKey = cache.getKey(implementationName,filename,fileString)
+			result = cache.get(cacheKey)
+		if result:
+			return filename,result
+
+	currentUID = 0
+	fileGroup = implementation.Mapper(implementation,[]).parseFile(filename,fileString)
+	result = fileGroup,currentUID
+
+	if cache:
+		with profiler.phase('cacheStore',filename):
+			cache.put(cacheKey,result)
+	return filename,result
+
+def _parseFileProfiled(task):
+	'''
+	_parseFile in a worker process when profiling. The worker's phase timings are sent back with the result
+	'''
+	#forget whatever was recorded before this process was forked
+	profiler.takeRecords()
+	result = _parseFile(task)
+	return result,profiler.takeRecords()
+
 class Node(object):
 	'''
 	Nodes represent functions
+
+	There can be a lot of nodes so they have __slots__ instead of a __dict__
+	Implementations which add attributes must list them in their own __slots__
 	'''
 
+	__slots__ = ('name','definitionString','source','fullSource','parent','characterPos','lineNumber','isFileRoot'
+		,'isInitNode','returns','callSites','uid','isLeaf','isTrunk')
+
 	#How we know if a function returns
 	returnPattern = re.compile(r"\Wreturn\W",re.MULTILINE)
 
+	patterns = patterns
+
 
 	def __init__(self,name,definitionString,source,parent,fullSource=None,characterPos=0,lineNumber=0,isFileRoot=False): #allow default characterPos, lineNumber for implicit nodes
 		#basic vars
@@ -66,16 +155,13 @@ class Node(object):
 		self.lineNumber = lineNumber #The line number the definition is on
 		self.isFileRoot = isFileRoot
 
-		#generate the name patterns for other nodes to search for this one
-		self.pattern = re.compile(r"(?:\W|\A)(%s)\s*\("%self.name,re.MULTILINE)  # The name pattern which is found by others eg. node()
-
 		self.determineNodeType() # Init node, etc.
 
-		self.sameScopePatterns = self.generateSameScopePatterns()  # The pattern to search for when the other node is in the same scope e.g. self.node()
-		self.namespacePatterns = self.generateAnyScopePatterns() # The pattern to search for with the namespace eg. Node.node()
-
 		#determine whether there are return statements or not
-		self.returns = self.returnPattern.search(self.source.sourceString)
+		self.returns = self.findReturns()
+
+		#every identifier this node calls. Used by generateEdges to find the nodes this might link to
+		self.callSites = self.findCallSites()
 
 		#increment the identifier
 		#Needed for the sake of a unique node name for graphviz
@@ -89,13 +175,33 @@ class Node(object):
 
 
 
+	#The name patterns which other nodes search for to find this one. They come from the shared PatternFactory so are never compiled twice
+	@property
+	def pattern(self):
+		'''
+		The name pattern which is found by others eg. node()
+		'''
+		return self.patterns.get('name',self.name)
+
+	@property
+	def sameScopePatterns(self):
+		'''
+		The pattern to search for when the other node is in the same scope e.g. self.node()
+		'''
+		return self.generateSameScopePatterns()
+
+	@property
+	def namespacePatterns(self):
+		'''
+		The pattern to search for with the namespace eg. Node.node()
+		'''
+		return self.generateAnyScopePatterns()
+
 	def generateSameScopePatterns(self):
-		return [re.compile(r"(?:\W|\A)%s\.%s\s*\("%(self.sameScopeKeyword,self.name),re.MULTILINE|re.DOTALL)]
+		return [self.patterns.get('sameScope',self.name,self.sameScopeKeyword)]
 
 	def generateAnyScopePatterns(self):
-		return [
-			re.compile(r"(?:[^a-zA-Z0-9\.]|\A)%s\s*\("%(self.getFullName()),re.MULTILINE|re.DOTALL)
-			]
+		return [self.patterns.get('anyScope',self.name,self._getFullNamespace())]
 
 	def getNamespace(self):
 		return self.parent.getNamespace()
@@ -111,12 +217,28 @@ class Node(object):
 		'''
 		Return the name with the namespace
 		'''
-		namespace = self.getNamespace()
-		if '/' in namespace:
-			namespace = namespace.rsplit('/',1)[1]
-
+		namespace = self._getFullNamespace()
 		return namespace+'.'+self.name if namespace else self.name
 
+	def findReturns(self):
+		'''
+		Whether the source has a return statement. Implementations which know the statements exactly can say so instead
+		'''
+		return bool(self.source.search(self.returnPattern))
+
+	def findCallSites(self):
+		'''
+		The identifiers this node calls. Found in the source unless the implementation knows the calls exactly
+		'''
+		return self.source.getCallSites()
+
+	def getCallSiteNames(self):
+		'''
+		The names which, when called, might call this node
+		A call to anything else can never link to this node (see callsites.py)
+		'''
+		return [self.name]
+
 	def linksTo(self,other):
 		raise NotImplementedError
 
@@ -130,6 +252,15 @@ class Node(object):
 		'''
 		return False
 
+	def _getFullNamespace(self):
+		'''
+		The namespace as it appears in the full name. Paths are cut down to the last part
+		'''
+		namespace = self.getNamespace()
+		if '/' in namespace:
+			namespace = namespace.rsplit('/',1)[1]
+		return namespace
+
 	def _getUID(self):
 		return 'node'+str(self.uid)
 	def _getFileGroup(self):
@@ -168,7 +299,11 @@ class Node(object):
 class Edge(object):
 	'''
 	Edges represent function calls
+	The graph keeps them in an EdgeList and only makes these when it is iterated
 	'''
+
+	__slots__ = ('node0','node1')
+
 	def __init__(self,node0,node1):
 		self.node0 = node0
 		self.node1 = node1
@@ -193,11 +328,66 @@ class Edge(object):
 	def hasStartNode(self,node0):
 		return node0 == self.node0
 
+class EdgeList(object):
+	'''
+	The edges of the graph as two parallel columns of node UIDs rather than an object per edge
+	Iterating yields edgeClass objects made as they are needed
+
+	nodesByUID only holds the nodes at either end of an edge so it also answers hasNode without scanning the columns
+	'''
+
+	__slots__ = ('edgeClass','nodesByUID','sources','targets')
+
+	def __init__(self,edgeClass=None):
+		self.edgeClass = edgeClass or Edge
+		self.nodesByUID = {}
+		self.sources = array('I')
+		self.targets = array('I')
+
+	def __len__(self):
+		return len(self.sources)
+
+	def __iter__(self):
+		edgeClass = self.edgeClass
+		for node0,node1 in self.iterNodes():
+			yield edgeClass(node0,node1)
+
+	def iterNodes(self):
+		'''
+		Yield (caller,callee) for every edge
+		'''
+		nodesByUID = self.nodesByUID
+		for i in xrange(len(self.sources)):
+			yield nodesByUID[self.sources[i]],nodesByUID[self.targets[i]]
+
+	def append(self,node0,node1):
+		'''
+		When we draw the edge, we know the calling function is definitely not a leaf...
+		and the called function is definitely not a trunk
+		'''
+		self.nodesByUID[node0.uid] = node0
+		self.nodesByUID[node1.uid] = node1
+		self.sources.append(node0.uid)
+		self.targets.append(node1.uid)
+		node0.isLeaf = False
+		node1.isTrunk = False
+
+	def hasNode(self,node):
+		'''
+		Whether any edge starts or ends at node
+		'''
+		return self.nodesByUID.get(node.uid) is node
+
+
 class Group(object):
 	'''
 	Groups represent namespaces
 	'''
 
+	__slots__ = ('name','definitionString','source','fullSource','parent','lineNumber','nodes','subgroups','uid')
+
+	patterns = patterns
+
 	def __init__(self,name,source,fullSource=None,definitionString='',parent=None,lineNumber=0,**kwargs):
 		self.name = name
 		self.definitionString = definitionString
@@ -209,12 +399,6 @@ class Group(object):
 		self.nodes = []
 		self.subgroups = []
 
-		#So that we can track object calls as well like:
-		# a = Obj()
-		# a.b()
-		self.newObjectPattern = self.generateNewObjectPattern()
-		self.newObjectAssignedPattern = self.generateNewObjectAssignedPattern()
-
 		#increment the identifier
 		#Needed for the sake of a unique node name for graphviz
 		global currentUID
@@ -225,25 +409,39 @@ class Group(object):
 		'''
 		__str__ is for printing to the DOT file
 		'''
-		#pdb.set_trace()
-		ret = 'subgraph '+self._getUID()
-		ret += '{\n'
+		return ''.join(self._iterDot())
+
+	def _iterDot(self):
+		'''
+		Yield the DOT subgraph for this group a piece at a time. Nested groups are yielded in place
+		'''
+		yield 'subgraph '+self._getUID()+'{\n'
 		if self.nodes:
 			for node in self.nodes:
-				ret += node._getUID() + ' '
+				yield node._getUID() + ' '
 				#if node.isFileRoot:
 				#	ret += ";{rank=source; %s}"%node._getUID()
 
-			ret += ';\n'
-		ret += 'label="%s";\n'%self.name;
-		ret += 'style=filled;\n';
-		ret += 'color=black;\n';
-		ret += 'graph[style=dotted];\n'
-		#pdb.set_trace()
+			yield ';\n'
+		yield 'label="%s";\n'%self.name
+		yield 'style=filled;\n'
+		yield 'color=black;\n'
+		yield 'graph[style=dotted];\n'
 		for subgroup in self.subgroups:
-			ret += str(subgroup)
-		ret += '}'
-		return ret
+			for fragment in subgroup._iterDot():
+				yield fragment
+		yield '}'
+
+	#So that we can track object calls as well like:
+	# a = Obj()
+	# a.b()
+	@property
+	def newObjectPattern(self):
+		return self.generateNewObjectPattern()
+
+	@property
+	def newObjectAssignedPattern(self):
+		return self.generateNewObjectAssignedPattern()
 
 	def getNamespace(self):
 		'''
@@ -304,6 +502,16 @@ class Group(object):
 		else:
 			return self
 
+	def _shiftUIDs(self,shift):
+		'''
+		Add 'shift' to the UID of this group and of every group and node in it
+		'''
+		self.uid += shift
+		for node in self.nodes:
+			node.uid += shift
+		for subgroup in self.subgroups:
+			subgroup._shiftUIDs(shift)
+
 	def _getFileName(self):
 		return self._getFileGroup().name
 
@@ -312,10 +520,13 @@ class SourceCode(object):
 	'''
 	SourceCode is a convenient object object representing:
 		source text (sourceString)
-		a line number array (characterToLineMap)
+		a line number index (lineIndex) shared by every slice of the same file
 
 	A sourcecode object is maintained internally in both the Group and Node and classes
 
+	Slices are views. Every slice of a file shares one buffer and only keeps its [start:stop] bounds into it
+	The sourceString of a slice is only built when something asks for it
+
 	Implementations will probably only have to overwrite the two properties:
 		blockComments
 		strings
@@ -328,11 +539,12 @@ class SourceCode(object):
 		sc[a] #character
 		scA + scB #addition as long as line numbers do not overlap
 		scA - scB #subtraction as long as scB is completely inside scA
+		sc.withoutSources([scA,scB]) #cut out several slices of sc at once
 		sc == True #truth testing (empty string)
 		str(sc) print with line numbers
 
 	And these are the methods
-		copy() #deepcopy
+		copy() #shallow copy. The lineIndex is never modified so it is shared
 		firstLineNumber() #of the entire object
 		lastLineNumber()  #of the entire object
 		remove(string) #and return new sourcecode
@@ -340,6 +552,8 @@ class SourceCode(object):
 		getPosition(lineNumber) #get character index at linenumber
 		getLineNumber(characterPos) #get line number of character
 		find(what,start) #run sourceString.find()
+		rfind(what,start) #run sourceString.rfind()
+		search(pattern) #run an anchorless regex without building the sourceString
 		extractBetweenDelimiters(a,b,startAt) #return new sourcecode between the first pair of delimiters after startAt
 		getSourceInBlock(bracketPos) #Return the source to the matching bracket
 		matchingBracketPos(bracketPos) #Return the matching bracket position
@@ -355,42 +569,97 @@ class SourceCode(object):
 	delimA='{'
 	delimB='}'
 
-	def __init__(self,sourceString,characterToLineMap=None):
+	nonWhitespacePattern = re.compile(r"\S")
+
+	#Every slice of a file is a SourceCode so keep them small
+	__slots__ = ('buffer','start','stop','firstLine','lineIndex','lineLo','lineHi','bracketIndex','_sourceString')
+
+	def __init__(self,sourceString,lineIndex=None,firstLine=1):
 		'''
 		Remove the comments and build the linenumber/file mapping while doing so
+
+		The text is:
+			buffer: the text of the whole file, shared by every slice
+			start,stop: the bounds of this source in the buffer
+
+		The line mapping is:
+			firstLine: the line number of character 0
+			lineIndex: the buffer offsets where subsequent lines begin (see lineindex.py)
+			lineLo,lineHi: the range of lineIndex entries which fall inside of this source
+
+		bracketIndex pairs up the brackets of the buffer (see bracketindex.py). It is shared like the lineIndex
 		'''
-		self.sourceString = sourceString
+		self.buffer = sourceString
+		self.firstLine = firstLine
+		self.bracketIndex = BracketIndex()
 
-		if characterToLineMap:
-			self.characterToLineMap = characterToLineMap
+		if lineIndex is not None:
+			self.lineIndex = lineIndex
 		else:
-			self.characterToLineMap = {}
-
+			self.lineIndex = LineIndex()
 			self._removeCommentsAndStrings()
-			self.sourceString = str(self.sourceString) #convert back to regular python string from mutable string
 
-			if DEBUG:
-				#print 'REMOVED COMMENTS',self
-				with open('cleanedSource','w') as outfile:
-					outfile.write(self.sourceString)
+		self.start = 0
+		self.stop = len(self.buffer)
+		self.lineLo = 0
+		self.lineHi = len(self.lineIndex)
+		self._sourceString = None
+
+		if lineIndex is None and DEBUG:
+			#print 'REMOVED COMMENTS',self
+			with open('cleanedSource','w') as outfile:
+				outfile.write(self.sourceString)
 
-		self.delimLen = len(self.delimA)
+	def __getstate__(self):
+		'''
+		When pickling (e.g. sending a parsed file back from a worker process), don't send the cached sourceString
+		Implementations can add their own slots
+		'''
+		state = {}
+		for cls in type(self).__mro__:
+			for name in getattr(cls,'__slots__',()):
+				state[name] = getattr(self,name)
+		state['_sourceString'] = None
+		return state
+
+	def __setstate__(self,state):
+		for name,value in state.iteritems():
+			setattr(self,name,value)
+
+	@property
+	def delimLen(self):
+		return len(self.delimA)
+
+	@property
+	def sourceString(self):
+		'''
+		The text of this source. Only built (once) when something asks for it
+		'''
+		if self._sourceString is None:
+			if self.start == 0 and self.stop == len(self.buffer):
+				self._sourceString = self.buffer
+			else:
+				self._sourceString = self.buffer[self.start:self.stop]
+		return self._sourceString
 
 	def __len__(self):
-		return len(self.sourceString)
+		return self.stop-self.start
 
 	def __getitem__(self,sl):
 		'''
-		If sliced, return a new object with the sourceString and the characterToLineMap sliced by [firstChar:lastChar]
+		If sliced, return a new view on the same buffer bounded by [firstChar:lastChar]
 
-		1. Slice the source string in the obvious way.
-		2. Slice the charactertolinemap
-			a. Remove character mappings that are not in between where we are shifting to
-			b. Take remaining characterPositions and shift them over by start shift
+		1. Move the bounds into the buffer. Nothing is copied
+		2. Narrow the range of the shared lineIndex to the lines which begin in (firstChar,lastChar]
+			and remember the line number of firstChar
 
 		'''
 		if type(sl) == int:
-			return self.sourceString[sl]
+			if sl < 0:
+				sl += len(self)
+			if sl < 0 or sl >= len(self):
+				raise IndexError("SourceCode index out of range")
+			return self.buffer[self.start+sl]
 
 		if type(sl) != slice:
 			raise Exception("Slice was not passed")
@@ -404,9 +673,9 @@ class SourceCode(object):
 			start = sl.start
 
 		if sl.stop is None:
-			stop = len(self.sourceString)
+			stop = len(self)
 		elif sl.stop < 0:
-			stop = len(self.sourceString)+sl.stop
+			stop = len(self)+sl.stop
 		else:
 			stop = sl.stop
 
@@ -415,22 +684,15 @@ class SourceCode(object):
 
 		ret = self.copy()
 
-		ret.sourceString = ret.sourceString[start:stop]
-
-		#filter out character mapping we won't be using
-		shiftedCharacterToLineMap = {}
-		characterPositions = ret.characterToLineMap.keys()
-		characterPositions = filter(lambda p: p>=start and p<=stop,characterPositions)
-
-		#shift existing character mappings to reflect the new start position
-		#If we start with 0, no shifting will take place
-		for characterPosition in characterPositions:
-			shiftedCharacterToLineMap[characterPosition-start] = ret.characterToLineMap[characterPosition]
+		ret.start = self.start+min(start,len(self))
+		ret.stop = self.start+min(stop,len(self))
+		ret._sourceString = None
 
 		#we need this to be sure that we can always get the line number no matter where we splice
-		shiftedCharacterToLineMap[0] = self.getLineNumber(start)
+		ret.firstLine = self.getLineNumber(start)
 
-		ret.characterToLineMap = shiftedCharacterToLineMap
+		ret.lineLo = self.lineIndex.bisect(ret.start,self.lineLo,self.lineHi)
+		ret.lineHi = self.lineIndex.bisect(ret.stop,self.lineLo,self.lineHi)
 		return ret
 
 	def __add__(self,other):
@@ -445,18 +707,15 @@ class SourceCode(object):
 		if self.lastLineNumber()>other.firstLineNumber():
 			raise Exception("When adding two pieces of sourcecode, the second piece must be completely after the first as far as line numbers go")
 
-		sourceString = self.sourceString + other.sourceString
+		#Adjacent views on the same buffer just become one wider view
+		if self.buffer is other.buffer and self.stop == other.start:
+			ret = self.copy()
+			ret.stop = other.stop
+			ret.lineHi = other.lineHi
+			ret._sourceString = None
+			return ret
 
-		shiftedCharacterToLineMap = {}
-		characterPositions = other.characterToLineMap.keys()
-		for characterPosition in characterPositions:
-			shiftedCharacterToLineMap[characterPosition+len(self.sourceString)] = other.characterToLineMap[characterPosition]
-
-		characterToLineMap = dict(self.characterToLineMap.items() + shiftedCharacterToLineMap.items())
-
-		ret = SourceCode(sourceString=sourceString,characterToLineMap=characterToLineMap)
-
-		return ret
+		return self._join([self,other])
 
 	def __sub__(self,other):
 		if not other:
@@ -481,44 +740,97 @@ class SourceCode(object):
 
 		return firstPart+secondPart
 
+	def withoutSources(self,sources):
+		'''
+		Return a new source with every one of 'sources' cut out of it
+		'sources' must be slices of this source. They are cut out by position in a single pass so their order doesn't matter
+		'''
+		spans = []
+		for source in sources:
+			if not source:
+				continue
+			if source.buffer is not self.buffer or source.start < self.start or source.stop > self.stop:
+				raise Exception("When cutting sources out of sourcecode, they must be slices lying completely within it")
+			spans.append((source.start,source.stop))
+		spans.sort()
+
+		#keep everything between the spans
+		pieces = []
+		pos = self.start
+		for start,stop in spans:
+			if start > pos:
+				pieces.append(self[pos-self.start:start-self.start])
+			pos = max(pos,stop)
+		if pos < self.stop or not pieces:
+			pieces.append(self[pos-self.start:])
+
+		if len(pieces) == 1:
+			return pieces[0]
+		return self._join(pieces)
+
+	def _join(self,pieces):
+		'''
+		Concatenate sources into a new buffer shifting their lines into a new lineIndex
+		If a piece begins exactly where a line of the previous piece does, the later piece's line number wins
+		'''
+		lineIndex = LineIndex()
+		length = 0
+		for piece in pieces:
+			for offset,lineNumber in piece._iterLines():
+				if len(lineIndex) and lineIndex.offsets[-1] == offset+length:
+					lineIndex.lineNumbers[-1] = lineNumber
+				else:
+					lineIndex.append(offset+length,lineNumber)
+			length += len(piece)
+
+		#the first entry is always for character 0 which is stored as firstLine instead
+		firstLine = lineIndex.lineNumbers[0]
+		del lineIndex.offsets[0]
+		del lineIndex.lineNumbers[0]
+
+		#copy each piece straight out of its buffer rather than slicing it first
+		sourceString = MString()
+		for piece in pieces:
+			sourceString.extend(piece.buffer,piece.start,piece.stop)
+		return self.__class__(sourceString=str(sourceString),lineIndex=lineIndex,firstLine=firstLine)
+
 	def __nonzero__(self):
 		'''
 		__nonzero__ is object evaluates to True or False
 		sourceString will be False when the sourceString has nothing or nothing but whitespace
 		'''
-		return self.sourceString.strip()!=''
+		return self.nonWhitespacePattern.search(self.buffer,self.start,self.stop) is not None
 
 	def __str__(self):
 		'''
 		Mostly for debugging. Print the source with line numbers
 		'''
 		ret = ''
-		for i, char in enumerate(self.sourceString):
-			if i in self.characterToLineMap:
-				ret += '%d: '%self.characterToLineMap[i]
-			ret += char
+		lastOffset = 0
+		for offset,lineNumber in self._iterLines():
+			ret += self.sourceString[lastOffset:offset]
+			ret += '%d: '%lineNumber
+			lastOffset = offset
+		ret += self.sourceString[lastOffset:]
 		return ret
 
 	def copy(self):
-		return copy.deepcopy(self)
+		return copy.copy(self)
 
 	def firstLineNumber(self):
 		'''
 		First line number of the entire source
+		Line numbers only ever increase so this is the line number of character 0
 		'''
-		try:
-			return min(self.characterToLineMap.values())
-		except ValueError:
-			raise Exception("Sourcecode has no line numbers")
+		return self.firstLine
 
 	def lastLineNumber(self):
 		'''
 		Last line number of the entire source
 		'''
-		try:
-			return max(self.characterToLineMap.values())
-		except ValueError:
-			raise Exception("Sourcecode has no line numbers")
+		if self.lineHi > self.lineLo:
+			return self.lineIndex.lineNumbers[self.lineHi-1]
+		return self.firstLine
 
 	def remove(self,stringToRemove):
 		'''
@@ -545,7 +857,7 @@ class SourceCode(object):
 		'''
 		From lineNumber, get the character position
 		'''
-		for pos,lineNumber in self.characterToLineMap.items():
+		for pos,lineNumber in self._iterLines():
 			if lineNumber == lineNumberRequest:
 				return pos
 
@@ -553,28 +865,64 @@ class SourceCode(object):
 
 	def getLineNumber(self,pos):
 		'''
-		Decrement until we find the first character of the line and can get the linenumber
+		Binary search for the last line beginning at or before pos
+		'''
+		if pos < 0:
+			raise Exception("could not get line number for position %d"%pos)
+
+		i = self.lineIndex.bisect(self.start+pos,self.lineLo,self.lineHi)
+		if i > self.lineLo:
+			return self.lineIndex.lineNumbers[i-1]
+		return self.firstLine
+
+	def search(self,pattern,start=0,stop=None):
+		'''
+		Run a compiled regex over this source (or over [start:stop] of it) without building the sourceString
+		Only for patterns which do not use anchors (^, \A, lookbehinds) which would see the edge of the buffer instead
+		\Z and $ do match at the end of the source. Match positions are positions in the buffer
+		'''
+		if stop is None:
+			stop = len(self)
+		return pattern.search(self.buffer,self.start+min(start,len(self)),self.start+min(stop,len(self)))
+
+	def getCallSites(self):
+		'''
+		The identifiers which are called in this source (see callsites.py)
+		'''
+		return getCallSites(self.buffer,self.start,self.stop)
+
+	def _iterLines(self):
+		'''
+		Yield (characterPos,lineNumber) for character 0 and every line beginning in this source
 		'''
-		while True:
-			try:
-				return self.characterToLineMap[pos]
-			except:
-				pos-=1
-				if pos < 0:
-					raise Exception("could not get line number for position %d"%pos)
+		yield 0,self.firstLine
+		for i in xrange(self.lineLo,self.lineHi):
+			yield self.lineIndex.offsets[i]-self.start,self.lineIndex.lineNumbers[i]
 
 	def find(self,what,start=0):
 		'''
 		Pass through 'find' makes implementations cleaner
 		'''
-		return self.sourceString.find(what,start)
+		pos = self.buffer.find(what,self.start+min(start,len(self)),self.stop)
+		if pos == -1:
+			return -1
+		return pos-self.start
+
+	def rfind(self,what,start=0):
+		'''
+		Pass through 'rfind' makes implementations cleaner
+		'''
+		pos = self.buffer.rfind(what,self.start+min(start,len(self)),self.stop)
+		if pos == -1:
+			return -1
+		return pos-self.start
 
 	def extractBetweenDelimiters(self,startAt=0):
 		'''
 		Return the source between the first pair of delimiters after 'startAt'
 		'''
 
-		start = self.sourceString.find(self.delimA,startAt)
+		start = self.find(self.delimA,startAt)
 		if start == -1:
 			return None
 		start += self.delimLen
@@ -608,12 +956,12 @@ class SourceCode(object):
 
 		delim = self[bracketPos]
 		if delim == self.delimA:
-			if self.sourceString[bracketPos+1]==self.delimB:
+			if bracketPos+1 < len(self) and self[bracketPos+1]==self.delimB:
 				return bracketPos + 1
 			else:
 				return self.endDelimPos(startAt=bracketPos+1)
 		elif delim == self.delimB:
-			if self.sourceString[bracketPos-1]==self.delimA:
+			if bracketPos > 0 and self[bracketPos-1]==self.delimA:
 				return bracketPos - 1
 			else:
 				return self.openDelimPos(startAt=bracketPos-1)
@@ -624,134 +972,142 @@ class SourceCode(object):
 		'''
 		Find the nearest end delimiter assuming that 'startAt' is inside of a block
 		'''
-
-		count = 1
-		i = startAt
-		while i<len(self.sourceString) and count>0:
-			tmp = self.sourceString[i:i+self.delimLen]
-			if tmp==self.delimA:
-				count += 1
-				i+=self.delimLen
-			elif tmp==self.delimB:
-				count -= 1
-				i+=self.delimLen
-			else:
-				i+=1
-
-		if count == 0:
-			return i-self.delimLen
-		else:
+		table = self.bracketIndex.getTable(self.buffer,self.delimA,self.delimB)
+		pos = table.closeAfter(self.start+startAt)
+		if pos == -1 or pos >= self.stop:
 			return -1
+		return pos-self.start
 
 	def openDelimPos(self,pos):
 		'''
 		Find the nearest begin delimiter assuming that 'pos' is inside of a block
 		TODO there is probably no reason why this also includes parenthesis
-		TODO this should probably just be the same function as endDelimPos
 		'''
+		if pos < 0:
+			return 0
 
-		count = 0
-		i = pos
-		while i>=0 and count>=0:
-			if self.sourceString[i] in ('}',')'):
-				count += 1
-			elif self.sourceString[i] in ('{','('):
-				count -= 1
-			i-=1
-
-		if count==-1:
-			return i+1
-		else:
+		table = self.bracketIndex.getTable(self.buffer,'{(','})')
+		openPos = table.openBefore(self.start+pos)
+		if openPos < self.start:
 			return 0
+		return openPos-self.start
 
 	def _removeCommentsAndStrings(self):
 		'''
 
 		Two things happen here:
-		a. Character by character, add those characters which are not part of comments or strings to a new string
-		   Same the new string as the 'sourceString' variable
-		b. At the same time, generate an array of line number beginnings called the 'characterToLineMap'
+		a. Add every span of the file which is not part of a comment or string to a new string
+		   Save the new string as the 'sourceString' variable
+		b. At the same time, generate the index of line number beginnings called the 'lineIndex'
+
+		This is a single pass over the file
+		One regex finds the next comment or string, everything before it is kept in bulk, and then we jog past the end of it
 
-		This uses a mutable string to save time on adding
+		The file can be a string or an mmap (see readSource). Either way, the kept spans are copied straight out of it
+		into one bytearray of the file's size. The cleaned source is never longer than the file
 
 		'''
 		print "Removing comments and strings..."
 
-		originalString = str(self.sourceString)
-		self.sourceString = MString('')
-		self.characterToLineMap = {}
+		originalString = self.buffer
+		pattern,delimiters = self._getCommentAndStringPattern()
+
+		kept = bytearray(len(originalString))
+		#writing through a memoryview is a plain copy where bytearray's own slice assignment is not
+		keptView = memoryview(kept)
+		keptLen = 0
 		lineCount = 1
-		self.characterToLineMap[0] = lineCount #character 0 is line #1
+		self.firstLine = lineCount #character 0 is line #1
 		lineCount += 1 #set up for next line which will be two
-		#pdb.set_trace()
-		i=0
-
-		inlineCommentLen = len(self.inlineComments)
 
-		#begin analyzing charactes 1 by 1 until we reach the end of the originalString
-		#-blockCommentLen so that we don't go out of bounds
+		i = 0
 		while i < len(originalString):
-			#check if the next characters are a block comment
-			#There are multiple types of block comments so we have to check them all
-			for blockComment in self.blockComments:
-				if type(blockComment['start']) == str:
-					blockCommentLen = len(blockComment['start'])
-					if originalString[i:][:blockCommentLen] == blockComment['start']:
-						#if it was a block comment, jog forward
-						prevI = i
-						i = originalString.find(blockComment['end'],i+blockCommentLen)+blockCommentLen
-
-						while originalString[i-1]=='\\':
-							i = originalString.find(blockComment['end'],i+blockCommentLen)+blockCommentLen
-
-						if i==-1+blockCommentLen:
-							#if we can't find the blockcomment and have reached the end of the file
-							#return the cleaned file
-							return
-
-						#increment the newlines
-						lineCount+=originalString[prevI:i].count('\n')
-
-						#still want to see the comments, just not what is inside
-						self.sourceString.append(blockComment['start'] + blockComment['end'])
-
-						break
-				else:
-					#is a regex blockcomment... sigh js sigh...
-					match = blockComment['start'].match(originalString[i:])
-					if match:
-						#print match.group(0)
-						#print originalString[i-5:i+5]
-						prevI = i
-
-						endMatch = blockComment['end'].search(originalString[i+match.end(0):])
-
-						if endMatch:
-							i = i+match.end(0)+endMatch.end(0)
-						else:
-							return
-
-						#increment the newlines
-						lineCount+=originalString[prevI:i].count('\n')
-						break
+			match = pattern.search(originalString,i)
+			if match:
+				keepUntil = match.start()
 			else:
-				#check if the next characters are an inline comment
-				if originalString[i:][:inlineCommentLen] == self.inlineComments:
-					#if so, find the end of the line and jog forward. Add one to jog past the newline
-					i = originalString.find("\n",i+inlineCommentLen+1)
-
-					#if we didn't find the end of the line, that is the end of the file. Return
-					if i==-1:
-						return
+				keepUntil = len(originalString)
+
+			#keep everything up to the comment, noting where each new line begins
+			newlinePos = originalString.find('\n',i,keepUntil)
+			while newlinePos != -1:
+				self.lineIndex.append(keptLen+newlinePos-i+1,lineCount)
+				lineCount += 1
+				newlinePos = originalString.find('\n',newlinePos+1,keepUntil)
+			keptView[keptLen:keptLen+keepUntil-i] = originalString[i:keepUntil]
+			keptLen += keepUntil-i
+
+			if not match:
+				break
+
+			#figure out which of the delimiters we hit
+			for groupIndex,blockComment in delimiters:
+				if match.start(groupIndex) != -1:
+					break
+
+			if blockComment is None:
+				#inline comment. Find the end of the line and jog forward. The newline itself is kept
+				i = originalString.find("\n",match.start()+len(self.inlineComments)+1)
+
+				#if we didn't find the end of the line, that is the end of the file
+				if i == -1:
+					break
+				continue
+
+			if type(blockComment['start']) == str:
+				i = originalString.find(blockComment['end'],match.end())
+
+				#if we can't find the end of the blockcomment, we have reached the end of the file
+				if i == -1:
+					break
+				i += len(blockComment['end'])
+
+				#still want to see the comments, just not what is inside
+				emptyComment = blockComment['start'] + blockComment['end']
+				keptView[keptLen:keptLen+len(emptyComment)] = emptyComment
+				keptLen += len(emptyComment)
+			else:
+				#is a regex blockcomment... sigh js sigh...
+				endMatch = blockComment['end'].search(originalString,match.end())
+				if not endMatch:
+					break
+				i = endMatch.end()
+
+			#increment the newlines
+			lineCount += originalString[match.start():i].count('\n')
+
+		#the view has to go before the bytearray can be resized
+		del keptView
+		del kept[keptLen:]
+		self.buffer = str(kept)
+
+	@classmethod
+	def _getCommentAndStringPattern(cls):
+		'''
+		Compile the blockComments and inlineComments into one alternation regex
+		Alternatives are in the same order as blockComments so the first delimiter listed wins like it always has
+
+		Returns the regex and a list of (groupIndex,blockComment) with None as the blockComment for inline comments
+		This is compiled once per language
+		'''
+		if '_commentAndStringPattern' not in cls.__dict__:
+			alternatives = []
+			delimiters = []
+			groupIndex = 1
+			for blockComment in cls.blockComments:
+				if type(blockComment['start']) == str:
+					alternatives.append('(%s)'%re.escape(blockComment['start']))
+					groups = 0
 				else:
-					#Otherwise, it is not a comment. Add to returnstr
-					self.sourceString.append(originalString[i])
-
-					#if the originalString is a newline, then we must note this
-					if originalString[i]=='\n':
-						self.characterToLineMap[len(self.sourceString)] = lineCount
-						lineCount += 1
-					i+=1
+					alternatives.append('(%s)'%blockComment['start'].pattern)
+					groups = blockComment['start'].groups
+				delimiters.append((groupIndex,blockComment))
+				groupIndex += 1 + groups
+			if cls.inlineComments:
+				alternatives.append('(%s)'%re.escape(cls.inlineComments))
+				delimiters.append((groupIndex,None))
+			cls._commentAndStringPattern = (re.compile('|'.join(alternatives)),delimiters)
+		return cls._commentAndStringPattern
 
 
 class Mapper(object):
@@ -763,90 +1119,241 @@ class Mapper(object):
 	SINGLE_QUOTE_PATTERN = re.compile(r'(?<!\\)"')
 	DOUBLE_QUOTE_PATTERN = re.compile(r"(?<!\\)'")
 
-	files = {}
-
-	def __init__(self,implementation,files):
+	def __init__(self,implementation,files,jobs=1,cache=None):
 		'''
 		Two things are happening:
-		1. We are overwriting all of the classes with the implementation's classes
-			So if we are working with a javascript file, the implementation variable points to javascript.py
-			Then, we overwrite every class in engine.py with all of the javascript.py's classes
-		2. We are loading the source files into the mapper class
-		'''
+		1. We are remembering the implementation module (javascript.py or python.py)
+			Everything the engine creates (sourcecode, edges) comes from the implementation's classes
+		2. We are loading the source files into the mapper
 
-		global Node,Edge,Group,Mapper,SourceCode
-		Node = implementation.Node
-		Edge = implementation.Edge
-		Group = implementation.Group
-		Mapper = implementation.Mapper
-		SourceCode = implementation.SourceCode
+		files can be any iterable of filenames (e.g. ingest.iterSourceFiles). Nothing is read until map
+		, which then reads and parses one file at a time so that work starts right away and only one file is held in memory
 
-		for f in files:
-			with open(f) as fi:
-				self.files[f] = fi.read()
+		With jobs > 1, files are parsed in that many worker processes
+		With a cache (see cache.py), files which were parsed by a previous run are loaded instead of parsed
+		'''
+		self.implementation = implementation
+		self.jobs = jobs
+		self.cache = cache
+		self.sourceFiles = files
 
+		#filename -> None for every file which was mapped, in the order the files were passed. That is the order of the graph
+		self.files = OrderedDict()
 
 	def map(self):
 		'''
-		I. For each file passed,
+		I. For each file passed (see parseFile),
 			1. Generate the sourcecode for that file
 			2. Generate a group from that file's sourcecode
 				a. The group init will recursively generate all of the subgroups and function nodes for that file
 		II.  Trim the groups bascially removing those which have no function nodes
 		III. Generate the edges
 		IV.  Return the file groups, function nodes, and edges
+
+		Everything is kept on the mapper so that update can redo only what changed
 		'''
 
-		#get the filename and the fileString
-		#only first file for now
-		nodes = []
-		fileGroups = []
-		for filename,fileString in self.files.items():
-			#remove .py from filename
-			filename = self.simpleFilename(filename)
-			print "Mapping %s"%filename
-
-			#generate sourcecode (remove comments and add line numbers)
-			source = SourceCode(fileString)
-
-			#Create all of the subgroups (classes) and nodes (functions) for this file
-			print "Generating function nodes..."
-			fileGroup = self.generateFileGroup(name=filename,source=source)
-			fileGroups.append(fileGroup)
-
-			#Append nodes generated to all nodes
-			nodes += fileGroup._allNodes()
-
-		#Trimming the groups mostly removes those groups with no function nodes
-		for group in fileGroups:
-			group.trimGroups()
-			if DEBUG:
-				print "Post trim, %s"%group.name
-				group._pprint()
+		self.files = OrderedDict()
+		self.fileGroups = {}
+		self.fileNodes = {}
+		self.trimmedNodes = []
+		self._parseFiles(self.sourceFiles,self.jobs)
+
+		nodes = self._getNodes()
 
 		#Figure out what functions map to what
 		print "Generating edges..."
-		edges = generateEdges(nodes)
+		with profiler.phase('generateEdges'):
+			self.callSiteIndex = CallSiteIndex(nodes)
+			self.edges = generateEdges(nodes,self.implementation.Edge,self.callSiteIndex)
 
-		#Trim off the nodes (mostly global-frame nodes that don't do anything)
-		finalNodes = []
-		for node in nodes:
-			if not node.isExtraneous(edges):
-				finalNodes.append(node)
+		#return everything we have done
+		return self._finish(nodes)
+
+	def update(self,filenames,order=None):
+		'''
+		After map, re-map when the files in 'filenames' were added, changed or deleted
+
+		An edge only depends on the files of its two nodes so edges between unchanged files are kept
+		Only edges which start or end in a changed file are generated again.
+		Returns the file groups, function nodes, and edges like map
+
+		Changed files keep their place in the graph. order is every file in the order map would have been passed them
+		and says where added files go. Without it, they go at the end
+		'''
+		changed = set(filenames)
+
+		#put back the nodes we trimmed last time. Whether they are extraneous might have changed
+		for node,index in reversed(self.trimmedNodes):
+			node.parent.nodes.insert(index,node)
+		self.trimmedNodes = []
+
+		#forget everything about the changed files
+		oldNodes = set()
+		for filename in changed:
+			oldNodes.update(self.fileNodes.pop(filename,[]))
+			self.fileGroups.pop(filename,None)
+		self.callSiteIndex.remove(oldNodes)
+
+		#and parse them again if they still exist
+		for filename in sorted(changed):
+			if os.path.isfile(filename):
+				self.files[filename] = None
 			else:
-				node.parent.nodes.remove(node)
-				del node
+				self.files.pop(filename,None)
+		if order is not None:
+			files = OrderedDict((filename,None) for filename in order if filename in self.files)
+			for filename in self.files:
+				files[filename] = None
+			self.files = files
+		newFilenames = [filename for filename in self.files if filename in changed]
+		self._parseFiles(newFilenames,min(self.jobs,len(newFilenames)))
+
+		newNodes = []
+		for filename in newFilenames:
+			newNodes += self.fileNodes[filename]
+		self.callSiteIndex.add(newNodes)
+
+		nodes = self._getNodes()
+		positions = dict((node,i) for i,node in enumerate(nodes))
+
+		#Keep the edges between unchanged nodes
+		edgeNodes = [(node0,node1) for node0,node1 in self.edges.iterNodes() if node0 not in oldNodes and node1 not in oldNodes]
+		for node in nodes:
+			node.isLeaf = True
+			node.isTrunk = True
 
+		#Then find the edges from the new nodes and to the new nodes
+		print "Generating edges..."
+		with profiler.phase('generateEdges'):
+			newNodes = set(newNodes)
+			pairs = set()
+			for node in newNodes:
+				for candidate in self.callSiteIndex.candidates(node):
+					pairs.add((node,candidate))
+				for caller in self.callSiteIndex.callers(node):
+					if caller not in newNodes:
+						pairs.add((caller,node))
+			for node0,node1 in sorted(pairs,key=lambda pair: (positions[pair[0]],positions[pair[1]])):
+				if node0.linksTo(node1):
+					edgeNodes.append((node0,node1))
+
+			#Edges come out in the same order map would have generated them
+			edgeNodes.sort(key=lambda pair: (positions[pair[0]],positions[pair[1]]))
+			self.edges = EdgeList(self.implementation.Edge)
+			for node0,node1 in edgeNodes:
+				self.edges.append(node0,node1)
+
+		return self._finish(nodes)
+
+	def _parseFiles(self,filenames,jobs):
+		'''
+		Parse the files, remembering the file group and nodes of each
+		'''
+		for filename,fileGroup in self._generateFileGroups(filenames,jobs):
+			self.files[filename] = None
+			self.fileGroups[filename] = fileGroup
+			self.fileNodes[filename] = list(fileGroup._allNodes())
+
+			#Trimming the groups mostly removes those groups with no function nodes
+			with profiler.phase('trim',filename):
+				fileGroup.trimGroups()
+			if DEBUG:
+				print "Post trim, %s"%fileGroup.name
+				fileGroup._pprint()
 
-		#return everything we have done
-		return fileGroups,finalNodes,edges
+	def _getNodes(self):
+		'''
+		Every node of every file, in file order
+		'''
+		nodes = []
+		for filename in self.files:
+			nodes += self.fileNodes[filename]
+		return nodes
+
+	def _finish(self,nodes):
+		'''
+		Trim off the nodes (mostly global-frame nodes that don't do anything)
+		Return the file groups, the nodes which are left, and the edges
+		'''
+		finalNodes = []
+		with profiler.phase('trim'):
+			for node in nodes:
+				if not node.isExtraneous(self.edges):
+					finalNodes.append(node)
+				else:
+					index = node.parent.nodes.index(node)
+					del node.parent.nodes[index]
+					self.trimmedNodes.append((node,index))
+
+		fileGroups = [self.fileGroups[filename] for filename in self.files]
+		return fileGroups,finalNodes,self.edges
+
+	def parseFile(self,filename,fileString):
+		'''
+		Generate the file group for a single file
+		'''
+		#remove .py from filename
+		name = self.simpleFilename(filename)
+		print "Mapping %s"%name
+
+		#generate sourcecode (remove comments and add line numbers)
+		with profiler.phase('stripComments',filename):
+			source = self.implementation.SourceCode(fileString)
+
+		#Create all of the subgroups (classes) and nodes (functions) for this file
+		print "Generating function nodes..."
+		with profiler.phase('generateGroups',filename):
+			return self.generateFileGroup(name=name,source=source)
+
+	def _generateFileGroups(self,filenames,jobs):
+		'''
+		Read and parse the files, in worker processes if we have more than one job, and yield (filename,fileGroup) in order
+		Files found in the cache are loaded instead and freshly parsed files are added to it
+
+		filenames is only iterated as the workers need more files so parsing starts while, e.g., a directory is still being walked
+
+		Each file's UIDs come back numbered from 0 so they are shifted to follow the previous file's
+		This way, the result is exactly the same as parsing every file here one after the other
+		'''
+		global currentUID
+
+		tasks = ((self.implementation.__name__,filename,self.cache) for filename in filenames)
+
+		pool = None
+		if jobs > 1:
+			pool = multiprocessing.Pool(jobs)
+			if profiler.isEnabled():
+				parsed = pool.imap(_parseFileProfiled,tasks)
+			else:
+				parsed = pool.imap(_parseFile,tasks)
+		else:
+			parsed = itertools.imap(_parseFile,tasks)
+
+		try:
+			uidShift = currentUID
+			for result in parsed:
+				if pool and profiler.isEnabled():
+					result,records = result
+					profiler.addRecords(records)
+
+				filename,(fileGroup,uidCount) = result
+				fileGroup._shiftUIDs(uidShift)
+				uidShift += uidCount
+				currentUID = uidShift
+				yield filename,fileGroup
+		finally:
+			if pool:
+				pool.terminate()
+			if self.cache:
+				self.cache.evict()
 
 	def generateFileGroup(self,name,source):
 		'''
 		Dummy function probably superclassed
 		This will initialize the global group for the entire source file
 		'''
-		return Group(name=name,source=source)
+		return self.implementation.Group(name=name,source=source)
 
 	def simpleFilename(self,filename):
 		'''
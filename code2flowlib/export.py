@@ -0,0 +1,230 @@
+'''
+Export the mapped graph for other tools so that they don't have to parse the DOT file
+
+GraphTable holds the graph as columns: one array per field of the groups, nodes and edges.
+Groups, nodes and edges refer to each other by their position in those columns.
+
+It can be written as
+	JSON Lines (.jsonl): one object per group, node and edge. Easy to read from anything
+	columnar (.c2f): the arrays written as they are in memory behind a small JSON header. Loading is a few reads
+'''
+
+from array import array
+import json
+import struct
+import sys
+
+#the files writeGraphFile writes
+EXTENSIONS = ('.jsonl','.c2f')
+
+FORMAT_MAGIC = 'C2FG'
+FORMAT_VERSION = 1
+
+#bits of GraphTable.nodeFlags
+IS_TRUNK = 1
+IS_LEAF = 2
+RETURNS = 4
+IS_FILE_ROOT = 8
+
+
+class GraphTable(object):
+	'''
+	groupParents and nodeGroups are positions in the group columns (-1 for none)
+	edgeSources and edgeTargets are positions in the node columns
+	uids are the ones used in the DOT file (e.g. node12)
+	'''
+
+	#(name,typecode) of every array column in the order they are written
+	COLUMNS = (
+		('groupUIDs','i'),
+		('groupParents','i'),
+		('groupLineNumbers','i'),
+		('nodeUIDs','i'),
+		('nodeGroups','i'),
+		('nodeLineNumbers','i'),
+		('nodeFlags','B'),
+		('edgeSources','i'),
+		('edgeTargets','i'),
+		)
+
+	#string columns. These go in the header
+	STRING_COLUMNS = ('groupNames','groupFileNames','nodeNames','nodeFullNames')
+
+	def __init__(self):
+		for name,typecode in self.COLUMNS:
+			setattr(self,name,array(typecode))
+		for name in self.STRING_COLUMNS:
+			setattr(self,name,[])
+
+	@classmethod
+	def fromGraph(cls,nodes,edges,groups):
+		'''
+		Build the table from what Mapper.map returns
+		'''
+		table = cls()
+
+		groupPositions = {}
+		def addGroup(group,parentPosition):
+			groupPositions[group] = len(table.groupUIDs)
+			table.groupUIDs.append(group.uid)
+			table.groupParents.append(parentPosition)
+			table.groupLineNumbers.append(group.lineNumber)
+			table.groupNames.append(group.name)
+			table.groupFileNames.append(group._getFileName())
+			for subgroup in group.subgroups:
+				addGroup(subgroup,groupPositions[group])
+		for group in groups:
+			addGroup(group,-1)
+
+		nodePositions = {}
+		for node in nodes:
+			nodePositions[node] = len(table.nodeUIDs)
+			table.nodeUIDs.append(node.uid)
+			table.nodeGroups.append(groupPositions.get(node.parent,-1))
+			table.nodeLineNumbers.append(node.lineNumber)
+			table.nodeFlags.append(
+				(IS_TRUNK if node.isTrunk else 0)
+				| (IS_LEAF if node.isLeaf else 0)
+				| (RETURNS if node.returns else 0)
+				| (IS_FILE_ROOT if node.isFileRoot else 0))
+			table.nodeNames.append(node.name)
+			table.nodeFullNames.append(node.getFullName())
+
+		for edge in edges:
+			table.edgeSources.append(nodePositions[edge.node0])
+			table.edgeTargets.append(nodePositions[edge.node1])
+
+		return table
+
+	def write(self,outfile):
+		'''
+		Write the columnar format: magic, version, header length, JSON header, then every array in COLUMNS order
+		'''
+		header = {'byteorder':sys.byteorder,'lengths':{}}
+		for name,typecode in self.COLUMNS:
+			header['lengths'][name] = len(getattr(self,name))
+		for name in self.STRING_COLUMNS:
+			header[name] = getattr(self,name)
+		header = json.dumps(header,separators=(',',':'))
+
+		outfile.write(FORMAT_MAGIC+struct.pack('<II',FORMAT_VERSION,len(header)))
+		outfile.write(header)
+		for name,typecode in self.COLUMNS:
+			getattr(self,name).tofile(outfile)
+
+	@classmethod
+	def read(cls,infile):
+		'''
+		Load a table written by write
+		'''
+		if infile.read(len(FORMAT_MAGIC)) != FORMAT_MAGIC:
+			raise ValueError("Not a code2flow graph file")
+		version,headerLength = struct.unpack('<II',infile.read(8))
+		if version != FORMAT_VERSION:
+			raise ValueError("Unsupported code2flow graph file version %d"%version)
+		header = json.loads(infile.read(headerLength))
+
+		table = cls()
+		for name in cls.STRING_COLUMNS:
+			setattr(table,name,header[name])
+		for name,typecode in cls.COLUMNS:
+			column = getattr(table,name)
+			column.fromfile(infile,header['lengths'][name])
+			if header['byteorder'] != sys.byteorder:
+				column.byteswap()
+		return table
+
+	def iterJsonLines(self):
+		'''
+		Yield one JSON line per group, then node, then edge. Ids are positions in the columns as above
+		'''
+		for i in xrange(len(self.groupUIDs)):
+			yield json.dumps({
+				'type':'group',
+				'id':i,
+				'uid':self.groupUIDs[i],
+				'name':self.groupNames[i],
+				'fileName':self.groupFileNames[i],
+				'parent':self.groupParents[i] if self.groupParents[i] != -1 else None,
+				'lineNumber':self.groupLineNumbers[i],
+				},sort_keys=True)+'\n'
+
+		for i in xrange(len(self.nodeUIDs)):
+			flags = self.nodeFlags[i]
+			yield json.dumps({
+				'type':'node',
+				'id':i,
+				'uid':self.nodeUIDs[i],
+				'name':self.nodeNames[i],
+				'fullName':self.nodeFullNames[i],
+				'group':self.nodeGroups[i] if self.nodeGroups[i] != -1 else None,
+				'lineNumber':self.nodeLineNumbers[i],
+				'isTrunk':bool(flags & IS_TRUNK),
+				'isLeaf':bool(flags & IS_LEAF),
+				'returns':bool(flags & RETURNS),
+				'isFileRoot':bool(flags & IS_FILE_ROOT),
+				},sort_keys=True)+'\n'
+
+		for i in xrange(len(self.edgeSources)):
+			yield json.dumps({
+				'type':'edge',
+				'source':self.edgeSources[i],
+				'target':self.edgeTargets[i],
+				'returns':bool(self.nodeFlags[self.edgeTargets[i]] & RETURNS),
+				},sort_keys=True)+'\n'
+
+	def writeJsonLines(self,outfile):
+		outfile.writelines(self.iterJsonLines())
+
+	@classmethod
+	def readJsonLines(cls,infile):
+		'''
+		Load a table written by writeJsonLines
+		'''
+		table = cls()
+		for line in infile:
+			obj = json.loads(line)
+			if obj['type'] == 'group':
+				table.groupUIDs.append(obj['uid'])
+				table.groupParents.append(-1 if obj['parent'] is None else obj['parent'])
+				table.groupLineNumbers.append(obj['lineNumber'])
+				table.groupNames.append(obj['name'])
+				table.groupFileNames.append(obj['fileName'])
+			elif obj['type'] == 'node':
+				table.nodeUIDs.append(obj['uid'])
+				table.nodeGroups.append(-1 if obj['group'] is None else obj['group'])
+				table.nodeLineNumbers.append(obj['lineNumber'])
+				table.nodeFlags.append(
+					(IS_TRUNK if obj['isTrunk'] else 0)
+					| (IS_LEAF if obj['isLeaf'] else 0)
+					| (RETURNS if obj['returns'] else 0)
+					| (IS_FILE_ROOT if obj['isFileRoot'] else 0))
+				table.nodeNames.append(obj['name'])
+				table.nodeFullNames.append(obj['fullName'])
+			elif obj['type'] == 'edge':
+				table.edgeSources.append(obj['source'])
+				table.edgeTargets.append(obj['target'])
+		return table
+
+
+def writeGraphFile(filename,nodes,edges,groups):
+	'''
+	Write the graph as JSON Lines or columnar depending on the extension of filename
+	'''
+	table = GraphTable.fromGraph(nodes,edges,groups)
+	if filename.endswith('.jsonl'):
+		with open(filename,'w') as outfile:
+			table.writeJsonLines(outfile)
+	else:
+		with open(filename,'wb') as outfile:
+			table.write(outfile)
+
+def readGraphFile(filename):
+	'''
+	Load a GraphTable from a file written by writeGraphFile
+	'''
+	if filename.endswith('.jsonl'):
+		with open(filename) as infile:
+			return GraphTable.readJsonLines(infile)
+	with open(filename,'rb') as infile:
+		return GraphTable.read(infile)
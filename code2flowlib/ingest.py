@@ -0,0 +1,287 @@
+'''
+Find the source files to map from the paths passed on the command line
+
+Directories are walked recursively and files come out one at a time, as they are found, so the mapper
+(which reads and parses each file as it gets it, see engine.py) can start before a big tree has been walked.
+
+What gets mapped:
+	- files passed explicitly are always mapped
+	- in directories, files with the extension of the language we are mapping
+	- which match one of the include globs, if there are any, and none of the exclude globs
+	- which are not ignored by a .gitignore
+	- which are no bigger than maxSize (generated bundles, minified code, etc. are slow to parse and unreadable as a graph)
+
+Globs are matched like .gitignore patterns: a glob without a slash (*.min.js, node_modules) matches the name of a file
+or directory anywhere in the tree. Anything else (lib/*.js, **/test/**) is matched against the path from the walked directory.
+'''
+
+import os
+import re
+
+try:
+	#much faster on python 2. It doesn't stat every file to find the directories
+	from scandir import walk
+except ImportError:
+	from os import walk
+
+#never worth walking into
+SKIPPED_DIRECTORIES = ('.git','.hg','.svn')
+
+
+def globToRegex(glob):
+	'''
+	Translate a glob to a regex matching the whole path. '*' and '?' don't match '/' but '**' does
+	'''
+	i = 0
+	ret = ''
+	while i < len(glob):
+		if glob.startswith('**/',i) and (i == 0 or glob[i-1] == '/'):
+			ret += '(?:.*/)?'
+			i += 3
+		elif glob.startswith('**',i):
+			ret += '.*'
+			i += 2
+		elif glob[i] == '*':
+			ret += '[^/]*'
+			i += 1
+		elif glob[i] == '?':
+			ret += '[^/]'
+			i += 1
+		elif glob[i] == '[' and glob.find(']',i+2) != -1:
+			end = glob.find(']',i+2)
+			charClass = glob[i+1:end]
+			if charClass[0] in '!^':
+				charClass = '^'+charClass[1:]
+			ret += '['+charClass.replace('\\','\\\\')+']'
+			i = end+1
+		else:
+			ret += re.escape(glob[i])
+			i += 1
+	return ret+r'\Z'
+
+
+class Rule(object):
+	'''
+	One glob, from the command line or a line of a .gitignore
+
+	base is the directory (relative to the walked directory) the glob is relative to
+	'''
+
+	__slots__ = ('regex','isNegated','isDirectoryOnly','isAnchored','base')
+
+	def __init__(self,glob,base=''):
+		self.isNegated = glob.startswith('!')
+		if self.isNegated:
+			glob = glob[1:]
+		elif glob.startswith('\\'):
+			glob = glob[1:]
+
+		self.isDirectoryOnly = glob.endswith('/')
+		glob = glob.rstrip('/')
+
+		self.isAnchored = '/' in glob
+		self.regex = re.compile(globToRegex(glob.lstrip('/')))
+		self.base = base
+
+	def matches(self,path,isDirectory):
+		'''
+		path is relative to the walked directory and uses '/'
+		'''
+		if self.isDirectoryOnly and not isDirectory:
+			return False
+		if not self.isAnchored:
+			return bool(self.regex.match(path.rsplit('/',1)[-1]))
+		if self.base:
+			if not path.startswith(self.base+'/'):
+				return False
+			path = path[len(self.base)+1:]
+		return bool(self.regex.match(path))
+
+
+def isMatched(rules,path,isDirectory):
+	'''
+	Like in a .gitignore, the last rule which matches decides. A '!' rule unmatches the path
+	'''
+	matched = False
+	for rule in rules:
+		if rule.matches(path,isDirectory):
+			matched = not rule.isNegated
+	return matched
+
+def readGitignore(directory,base):
+	'''
+	Return the rules of the .gitignore in directory, if there is one
+	'''
+	rules = []
+	try:
+		with open(os.path.join(directory,'.gitignore')) as infile:
+			lines = infile.read().splitlines()
+	except IOError:
+		return rules
+
+	for line in lines:
+		line = line.rstrip()
+		if line and not line.startswith('#'):
+			rules.append(Rule(line,base))
+	return rules
+
+
+def iterSourceFiles(paths,extensions,include=(),exclude=(),maxSize=None,gitignore=True):
+	'''
+	Yield the files to map in the order the paths were passed. Directories are walked top down in sorted order
+	extensions are the file extensions (without the '.') to map in directories
+	include and exclude are lists of globs
+	maxSize is in bytes
+
+	Raises an exception for a path which does not exist
+	'''
+	seen = set()
+	for path in paths:
+		if os.path.isfile(path):
+			if os.path.normpath(path) not in seen:
+				seen.add(os.path.normpath(path))
+				yield path
+		elif os.path.isdir(path):
+			for filename in SourceDirectory(path,extensions,include,exclude,maxSize,gitignore).iterFiles():
+				if os.path.normpath(filename) not in seen:
+					seen.add(os.path.normpath(filename))
+					yield filename
+		else:
+			raise Exception('Could not find "%s"'%path)
+
+
+class SourceDirectory(object):
+	'''
+	A directory passed on the command line and the rules for what is mapped under it
+
+	The walk asks it which directories to go into and which files to map.
+	Watch mode (see watch.py) asks it the same questions about files and directories created later
+	, so both always agree on what is mapped.
+
+	Paths are the way the walk makes them: root joined with the directories below it
+	'''
+
+	def __init__(self,root,extensions,include=(),exclude=(),maxSize=None,gitignore=True):
+		self.root = root
+		self.extensions = tuple('.'+extension for extension in extensions)
+		self.includeRules = [Rule(glob) for glob in include]
+		self.excludeRules = [Rule(glob) for glob in exclude]
+		self.maxSize = maxSize
+		self.gitignore = gitignore
+
+		#directory relative to root -> the .gitignore rules in effect there. Subdirectories inherit them
+		self.gitignoreRules = {}
+
+	def getRelativePath(self,path):
+		'''
+		The path from root using '/'. '' for root itself. None if path is not under root
+		'''
+		relativePath = os.path.relpath(path,self.root).replace(os.sep,'/')
+		if relativePath == '.':
+			return ''
+		if relativePath == '..' or relativePath.startswith('../'):
+			return None
+		return relativePath
+
+	def forgetGitignores(self):
+		'''
+		Read the .gitignore files again the next time they are needed, e.g. after one changed
+		'''
+		self.gitignoreRules = {}
+
+	def _getGitignoreRules(self,relativeDirectory):
+		try:
+			return self.gitignoreRules[relativeDirectory]
+		except KeyError:
+			pass
+
+		if not self.gitignore:
+			rules = []
+		elif relativeDirectory == '':
+			rules = readGitignore(self.root,'')
+		else:
+			parent = relativeDirectory.rsplit('/',1)[0] if '/' in relativeDirectory else ''
+			rules = self._getGitignoreRules(parent)+readGitignore(os.path.join(self.root,relativeDirectory),relativeDirectory)
+		self.gitignoreRules[relativeDirectory] = rules
+		return rules
+
+	def isWalkedDirectory(self,path):
+		'''
+		Whether the walk goes into the directory. Only the directory itself is checked, not those above it
+		'''
+		relativePath = self.getRelativePath(path)
+		if relativePath is None:
+			return False
+		if relativePath == '':
+			return True
+
+		parent,name = relativePath.rsplit('/',1) if '/' in relativePath else ('',relativePath)
+		if name in SKIPPED_DIRECTORIES:
+			return False
+		return not (isMatched(self._getGitignoreRules(parent),relativePath,True) or isMatched(self.excludeRules,relativePath,True))
+
+	def _isMatchedFile(self,relativePath):
+		'''
+		Whether the extension and the globs (ours and the .gitignore's) let a file be mapped
+		'''
+		if not relativePath.endswith(self.extensions):
+			return False
+		if self.includeRules and not isMatched(self.includeRules,relativePath,False):
+			return False
+		parent = relativePath.rsplit('/',1)[0] if '/' in relativePath else ''
+		return not (isMatched(self.excludeRules,relativePath,False) or isMatched(self._getGitignoreRules(parent),relativePath,False))
+
+	def _isTooBig(self,path):
+		return self.maxSize is not None and os.path.getsize(path) > self.maxSize
+
+	def isSourceFile(self,path):
+		'''
+		Whether the walk would map the file if it found it. A file which no longer exists is judged by the globs alone
+		The directories above the file are not checked. The walk (and the watcher) never go into the excluded ones
+		'''
+		relativePath = self.getRelativePath(path)
+		if not relativePath or not self._isMatchedFile(relativePath):
+			return False
+		return not (os.path.isfile(path) and self._isTooBig(path))
+
+	def iterDirectories(self,top=None):
+		'''
+		Yield every directory the walk goes into, top down in sorted order, starting with top (root by default)
+		'''
+		for directory,filenames in self._walk(top or self.root):
+			yield directory
+
+	def iterFiles(self,top=None,verbose=True):
+		'''
+		Yield the files to map under top (root by default). With verbose, say which files are skipped for their size
+		'''
+		for directory,filenames in self._walk(top or self.root):
+			for filename in sorted(filenames):
+				path = os.path.join(directory,filename)
+				if not self._isMatchedFile(self.getRelativePath(path)):
+					continue
+				if self._isTooBig(path):
+					if verbose:
+						print "Skipping %s (%dKB is over the size limit)"%(path,os.path.getsize(path)/1024)
+					continue
+				yield path
+
+	def _walk(self,top):
+		'''
+		Yield (directory,filenames) for top and every directory below it we go into
+		'''
+		for directory,dirnames,filenames in walk(top):
+			#walk into the directories in order and skip the ignored ones altogether
+			dirnames.sort()
+			for dirname in list(dirnames):
+				if not self.isWalkedDirectory(os.path.join(directory,dirname)):
+					dirnames.remove(dirname)
+			yield directory,filenames
+
+def detectLanguage(paths,extensions,**filters):
+	'''
+	The language is the extension of the first file we would map. None if there is no such file
+	'''
+	for filename in iterSourceFiles(paths,extensions,**filters):
+		return os.path.splitext(filename)[1][1:]
+	return None
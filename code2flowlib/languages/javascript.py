@@ -6,8 +6,16 @@ Functions that begin with an "_" are local and do not replace anything in engine
 
 from code2flowlib.engine import *
 
+patterns = patterns.extend({
+	'windowAnyScope':(r"(?:[^a-zA-Z0-9\.]|\A)window\.%(fullName)s\s*\(",re.MULTILINE|re.DOTALL),
+	'newObject':(r'new\s+%(name)s\s*\(',0),
+	'newObjectAssigned':(r'(\w)\s*=\s*new\s+%(name)s\s*\(',0),
+	})
+
 class Node(Node):
+	__slots__ = ()
 	sameScopeKeyword = 'this'
+	patterns = patterns
 
 	def linksTo(self,other):
 		#Can either line in local scope using 'this' keyword
@@ -44,21 +52,26 @@ class Node(Node):
 		How you would call this node from any scope
 		'''
 		return super(Node,self).generateAnyScopePatterns()+[
-			re.compile(r"(?:[^a-zA-Z0-9\.]|\A)window\.%s\s*\("%(self.getFullName()),re.MULTILINE|re.DOTALL)
+			self.patterns.get('windowAnyScope',self.name,self._getFullNamespace())
 			]
 
 class Edge(Edge):
-	pass
+	__slots__ = ()
 
 
 class Group(Group):
+	__slots__ = ('isAnon',)
 	globalFrameName = 'window'
+	patterns = patterns
 
+	#How blocks are defined. Each is tried on the source between the last '}' and the block
+	#A definition runs to the end of that source which must end with 'end' (the ')' of the arguments or an '=')
+	#The patterns only match the start of the definition. The leftmost one whose '(' comes before that ')' is the definition
 	PATTERNS = [
-		{'type':'function','pattern':re.compile(r".*?\W(function\s+(\w+)\s*\(.*?\)\s*\Z)",re.DOTALL)}
-		,{'type':'function','pattern':re.compile(r".*?[^a-zA-Z0-9_\.]+(([\w\.]+)\s*[\:\=]\s*function\s*\(.*?\)\s*\Z)",re.DOTALL)}
-		,{'type':'object','pattern':re.compile(r".*?\W(([\w\.]+)\s*\=\s*\Z)",re.DOTALL)}
-		,{'type':'anonFunction','pattern':re.compile(r".*?\(\s*(function\s*\(.*?\)\s*\Z)",re.DOTALL)}
+		{'type':'function','end':')','pattern':re.compile(r"\W(function\s+(\w+)\s*\()")}
+		,{'type':'function','end':')','pattern':re.compile(r"[^a-zA-Z0-9_\.](([\w\.]+)\s*[\:\=]\s*function\s*\()")}
+		,{'type':'object','end':'=','pattern':re.compile(r"\W(([\w\.]+)\s*\=\s*\Z)")}
+		,{'type':'anonFunction','end':')','pattern':re.compile(r"\(\s*(function\s*\()")}
 		]
 
 
@@ -167,10 +180,10 @@ class Group(Group):
 		self.subgroups = savedSubgroups
 
 	def generateNewObjectPattern(self):
-		return re.compile(r'new\s+%s\s*\('%self.name)
+		return self.patterns.get('newObject',self.name)
 
 	def generateNewObjectAssignedPattern(self):
-		return re.compile(r'(\w)\s*=\s*new\s+%s\s*\('%self.name)
+		return self.patterns.get('newObjectAssigned',self.name)
 
 	"""
 	def generateNodes(self):
@@ -206,11 +219,8 @@ class Group(Group):
 				return False
 
 	def generateImplicitNode(self,blocksToRemove):
-		#Get source by subtracting all of the 'spoken for' blocks
-		source = self.source.copy()
-
-		for block in blocksToRemove:
-			source -= block.fullSource
+		#Get source by cutting out all of the 'spoken for' blocks
+		source = self.source.withoutSources([block.fullSource for block in blocksToRemove])
 
 		#Depending on whether or not this is the file root (global frame)
 		#, set a flag and the node name
@@ -233,10 +243,20 @@ class Group(Group):
 		preBlockSource = self.source[:openBracket]
 		blockSource = self.source[openBracket:closeBracket+1]
 
-		for pattern in self.PATTERNS:
-			newGroup = self.newGroupFromSourcesAndPattern(preBlockSource,blockSource,pattern)
-			if newGroup:
-				return newGroup
+		#We are looking for a function name
+		#Start by limiting the search area to that inbetween the last closed bracket and here
+		lastBracket = preBlockSource.rfind('}')
+		if lastBracket == -1:
+			lastBracket = 0
+
+		#Only the patterns for what the source ends with can match
+		endPos = preBlockSource.lastNonWhitespacePos()
+		if endPos >= lastBracket:
+			for pattern in self.PATTERNS:
+				if preBlockSource[endPos] == pattern['end']:
+					newGroup = self.newGroupFromSourcesAndPattern(preBlockSource,blockSource,pattern,lastBracket,endPos)
+					if newGroup:
+						return newGroup
 
 		if DEBUG:
 			print "===================="
@@ -245,57 +265,70 @@ class Group(Group):
 
 		return None
 
-	def newGroupFromSourcesAndPattern(self,preBlockSource,blockSource,pattern):
+	def newGroupFromSourcesAndPattern(self,preBlockSource,blockSource,pattern,lastBracket,endPos):
 		'''
 		Given a functionPattern to test for, sourcecode before the block, and sourcecode within the block,
 		Try to generate a new group
 
-
+		lastBracket and endPos bound the search. Functions must open their arguments before endPos
 		'''
-
-		#We are looking for a function name
-		#Start by limiting the search area to that inbetween the last closed bracket and here
-		#Then, try to match the pattern
-		lastBracket = preBlockSource.sourceString.rfind('}')
-		if lastBracket == -1:
-			lastBracket = 0
-		match = pattern['pattern'].match(preBlockSource.sourceString[lastBracket:])
+		if pattern['end'] == ')':
+			match = preBlockSource.search(pattern['pattern'],lastBracket,endPos)
+		else:
+			match = preBlockSource.search(pattern['pattern'],lastBracket)
 
 		#If we found a match, generate a group
 		if match:
+			definitionPos = match.start(1)-preBlockSource.start
+
 			#name the function
 			if pattern['type']=='anonFunction':
 				name = "(anon)"
 			else:
 				name = match.group(2)
 
-			#determine what group to attach this to.
-			#if there was a dot in the namespace, we might need to attach this to something other than the group it was defined within
-			attachTo = self
-			if '.' in name:
-				namespace, name = name.rsplit('.',1)
-				group = self.findNamespace(namespace,self)
-				if group:
-					attachTo = group
-
-			#generate the definition and line number
-			definitionString = match.group(1)
-			lineNumber = preBlockSource.getLineNumber(match.start(1)+lastBracket)
-			fullSource = preBlockSource[lastBracket+match.start(1):]+blockSource
-
-			#finally, generate the group
-			return Group(
-				name=name
-				,source=blockSource[1:-1] #source without the brackets
-				,fullSource=fullSource
-				,definitionString=definitionString
-				,parent=attachTo
-				,lineNumber=lineNumber
-				,isFunction=pattern['type'] in ('function','anonFunction')
-				,isAnon=pattern['type'] == 'anonFunction')
+			return self.newGroupFromDefinition(preBlockSource,blockSource,pattern['type'],name,definitionPos)
 
 		return None
 
+	def newGroupFromDefinition(self,preBlockSource,blockSource,definitionType,name,definitionPos):
+		'''
+		Generate the group for a block whose definition (e.g. "a.b = function(c)") begins at definitionPos
+		definitionType is the type of the pattern which found it
+		'''
+
+		#determine what group to attach this to.
+		#if there was a dot in the namespace, we might need to attach this to something other than the group it was defined within
+		attachTo = self
+		if '.' in name:
+			namespace, name = name.rsplit('.',1)
+			group = self.findNamespace(namespace,self)
+			if group:
+				attachTo = group
+
+		#generate the definition and line number. The definition runs up to the block
+		definitionSource = preBlockSource[definitionPos:]
+		definitionString = definitionSource.sourceString
+		lineNumber = preBlockSource.getLineNumber(definitionPos)
+		fullSource = definitionSource+blockSource
+
+		#source without the brackets. A block which is never closed runs to the end of the file
+		if blockSource[-1] == self.source.delimB:
+			source = blockSource[1:-1]
+		else:
+			source = blockSource[1:]
+
+		#finally, generate the group
+		return self.__class__(
+			name=name
+			,source=source
+			,fullSource=fullSource
+			,definitionString=definitionString
+			,parent=attachTo
+			,lineNumber=lineNumber
+			,isFunction=definitionType in ('function','anonFunction')
+			,isAnon=definitionType == 'anonFunction')
+
 	def generateOrAppendToGroup(self,node):
 		openDelimPos = self.source.openDelimPos(node.characterPos)
 
@@ -311,6 +344,7 @@ class Group(Group):
 			print 'what is this?'
 
 class SourceCode(SourceCode):
+	__slots__ = ()
 	blockComments = [
 		{'start':'"','end':'"'}
 		,{'start':"'",'end':"'"}
@@ -319,6 +353,15 @@ class SourceCode(SourceCode):
 		]
 	inlineComments = "//"
 
+	def lastNonWhitespacePos(self):
+		'''
+		Position of the last character which is not whitespace or -1
+		'''
+		i = self.stop-1
+		while i >= self.start and self.buffer[i].isspace():
+			i -= 1
+		return i-self.start
+
 
 class Mapper(Mapper):
 	def generateFileGroup(self,name,source):
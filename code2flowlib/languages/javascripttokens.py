@@ -0,0 +1,443 @@
+'''
+A javascript front end built on a tokenizer. Selected with --parser tokens
+
+javascript.py makes three passes over a file: the blockComments regexes strip the comments and strings
+(guessing at regex literals with '[\=\(]\s*\/'), the bracket index pairs up the brackets and then, before every block
+, the PATTERNS are searched for in the source leading up to it.
+Here, one pass of tokenize over the file does all of that. It knows a regex literal from a division by the token before it
+and it reads template literals, including the ${} expressions inside of them.
+While the cleaned source is written, the '{' and '}' go into the bracket table, the definitions in front of the blocks
+and every identifier followed by an open paren go into the TokenTable
+
+The Group/Node/Edge model is javascript.py's so edges, trimming, the cache, dotgenerator and export
+don't know the difference. The cleaned source of each node is still kept for linksTo
+but the patterns are only searched for in front of the calls in the TokenTable which end with the other node's name.
+
+What it costs: tokenize is a python loop over every token where javascript.py's regexes run in C.
+Removing the comments and strings takes about 5x as long (0.6-0.9s against 0.11-0.14s on mootools.js replicated 8 times)
+and the TokenTable needs about 40% more memory at its peak (23MB against 17MB).
+Searching only in front of the calls more than makes up for it: edges take 1.0s against 2.7s
+so the whole map takes 2.7s against 3.3s for javascript.py.
+
+What is different from the regex front end:
+	- regex literals don't eat the '=' or '(' in front of them, so e.g. the call in a.split(/,/) is found
+	- comments between a definition and its block (function a() /* ... */ {) don't hide it
+	- template literals are literals. The calls in their ${} expressions are kept
+	- a node's calls are the call tokens in its own source
+	- so a name and a paren which only meet once a block is cut out of the source (a function b(){}()) are no call
+'''
+
+from bisect import bisect_left
+from collections import deque
+
+import code2flowlib.languages.javascript as javascript
+from code2flowlib.bracketindex import BracketTable
+from code2flowlib.engine import *
+
+#one token after any whitespace
+#'/' is left to tokenize which knows whether it begins a regex literal or is a division
+tokenPattern = re.compile(r'''\s*(?:
+	(?P<comment>//[^\n]*|/\*[\s\S]*?(?:\*/|\Z))
+	|(?P<string>"(?:[^"\\\n]|\\[\s\S])*"?|'(?:[^'\\\n]|\\[\s\S])*'?)
+	|(?P<template>`)
+	|(?P<name>[a-zA-Z_$\x80-\xff][\w$\x80-\xff]*)
+	|(?P<number>\.?[0-9][\w.]*)
+	|(?P<slash>/)
+	|(?P<punct>>>>?=?|<<=?|[=!]==?|=>|&&|\|\||\?\?|\+\+|--|\*\*|\.\.\.|[-+*%&|^<>]=|[^\s\w"'`/])
+	)''',re.VERBOSE)
+
+regexLiteralPattern = re.compile(r"/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[\w$]*")
+
+#the text of a template literal from after the '`' or the '}' of an expression up to the next '${' or the closing '`'
+templatePattern = re.compile(r"(?:[^`\\$]|\\[\s\S]|\$(?!\{))*(`|\$\{)?")
+
+#after these, a '/' begins a regex literal
+KEYWORDS_BEFORE_EXPRESSION = frozenset(('return','typeof','instanceof','in','of','new','delete','void','throw','case','do','else','yield','await'))
+
+#what the literals and comments are replaced with in the cleaned source
+#A template literal is cut into its parts around the expressions. The expressions are kept in parens
+PLACEHOLDERS = {
+	'templateHead':'`(',
+	'templateMiddle':')(',
+	'templateTail':')`',
+	'regex':'//',
+	}
+
+#how many of the last significant tokens are kept to recognize a definition
+RECENT = 64
+
+#the names in the definitions, the same as ([\w\.]+) and (\w+) in javascript.Group.PATTERNS
+chainPattern = re.compile(r"[\w\.]+\Z")
+identifierPattern = re.compile(r"\w+\Z")
+
+#regex characters which let a pattern match more characters than it has or match without the name at its end
+unboundedPattern = re.compile(r"[*+{|\\]")
+
+
+def tokenize(text):
+	'''
+	Yield (kind,start,stop) for every token of javascript text. Whitespace is skipped
+
+	kinds are:
+		name, number, punct: the code
+		string, regex, template: literals
+		templateHead, templateMiddle, templateTail: the parts of a template literal with expressions
+			e.g. `a${b}c${d}e` is templateHead `a${, name b, templateMiddle }c${, name d, templateTail }e`
+		comment: // to the end of the line or /* */
+
+	A '/' begins a regex literal unless the token before it ends an expression (a name, a literal, ')', ']', ...)
+	'''
+	pos = 0
+	#True for each open '{' which is the '${' of a template literal
+	braces = []
+	regexCanFollow = True
+	matchToken = tokenPattern.match
+
+	while True:
+		match = matchToken(text,pos)
+		if match is None:
+			return
+		kind = match.lastgroup
+		start,pos = match.span(kind)
+
+		if kind == 'name':
+			regexCanFollow = text[start:pos] in KEYWORDS_BEFORE_EXPRESSION
+		elif kind == 'punct':
+			char = text[start]
+			if char == '}' and braces and braces.pop():
+				templateMatch = templatePattern.match(text,pos)
+				pos = templateMatch.end()
+				if templateMatch.group(1) == '${':
+					kind = 'templateMiddle'
+					braces.append(True)
+				else:
+					kind = 'templateTail'
+				regexCanFollow = kind == 'templateMiddle'
+			else:
+				if char == '{':
+					braces.append(False)
+				regexCanFollow = char not in ')]' and text[start:pos] not in ('++','--')
+		elif kind == 'template':
+			templateMatch = templatePattern.match(text,pos)
+			pos = templateMatch.end()
+			if templateMatch.group(1) == '${':
+				kind = 'templateHead'
+				braces.append(True)
+			regexCanFollow = kind == 'templateHead'
+		elif kind == 'slash':
+			regexMatch = regexCanFollow and regexLiteralPattern.match(text,start)
+			if regexMatch:
+				kind = 'regex'
+				pos = regexMatch.end()
+				regexCanFollow = False
+			else:
+				kind = 'punct'
+				if text[pos:pos+1] == '=':
+					pos += 1
+				regexCanFollow = True
+		elif kind != 'comment':
+			regexCanFollow = False
+
+		yield kind,start,pos
+
+def getChainName(recent,i):
+	'''
+	The dotted name (e.g. a.b.c) which ends with the token recent[i] and where it begins
+	None if there is none
+	'''
+	if -i > len(recent):
+		return None
+	stop = recent[i][3]
+	pieces = []
+	while -i <= len(recent):
+		kind,text,tokenStart,tokenStop = recent[i]
+		if (kind not in ('name','number') and text != '.') or (pieces and tokenStop != start):
+			break
+		pieces.append(text)
+		start = tokenStart
+		i -= 1
+
+	match = chainPattern.search(''.join(reversed(pieces)))
+	if not match:
+		return None
+	return match.group(),stop-len(match.group())
+
+def getFunctionDefinition(recent):
+	'''
+	The definition of the function whose arguments the open paren after the recent tokens would begin
+	(type,name,definitionPos) like javascript.Group.PATTERNS find or None if the paren begins no function
+		function name(
+		a.b = function(  or  a.b: function(
+		(function(
+	'''
+	if not recent or recent[-1][0] != 'name':
+		return None
+
+	if recent[-1][1] == 'function':
+		if len(recent) < 2:
+			return None
+		if recent[-2][1] in (':','='):
+			chain = getChainName(recent,-3)
+			if chain:
+				return 'function',chain[0],chain[1]
+		elif recent[-2][1] == '(':
+			return 'anonFunction','(anon)',recent[-1][2]
+		return None
+
+	if len(recent) >= 2 and recent[-2][1] == 'function' and identifierPattern.match(recent[-1][1]):
+		return 'function',recent[-1][1],recent[-2][2]
+	return None
+
+
+class TokenTable(object):
+	'''
+	What the tokenizer found in a file. Positions are in the cleaned source
+
+		callPositions,callNames: every identifier which is followed by an open paren, in order
+		callStops,callParens: where each of those identifiers ends and where its open paren is
+		definitions: the position of the '{' of every block which is a function or an object -> (type,name,definitionPos)
+			where type is that of javascript.Group.PATTERNS and definitionPos is where the definition begins
+
+	Like the lineIndex, one table is shared by every slice of a file
+	'''
+
+	__slots__ = ('callPositions','callNames','callStops','callParens','definitions')
+
+	def __init__(self):
+		self.callPositions = array('i')
+		self.callNames = []
+		self.callStops = array('i')
+		self.callParens = array('i')
+		self.definitions = {}
+
+	def __getstate__(self):
+		'''
+		The table is only needed while parsing. Don't pickle it with the file group
+		'''
+		return {'callPositions':array('i'),'callNames':[],'callStops':array('i'),'callParens':array('i'),'definitions':{}}
+
+	def __setstate__(self,state):
+		for name,value in state.iteritems():
+			setattr(self,name,value)
+
+	def getCalls(self,start,stop,spans=()):
+		'''
+		The identifiers called in [start,stop) outside of the sorted (start,stop) spans
+		Returned as {name:[(nameStop,parenPos),...]} with the positions in what is left of [start,stop) once the spans are cut out
+		'''
+		calls = {}
+		shift = start #a position in the file minus this is the position in what is left
+		for spanStart,spanStop in list(spans)+[(stop,stop)]:
+			i = bisect_left(self.callPositions,start)
+			stopAt = bisect_left(self.callPositions,spanStart)
+			for j in xrange(i,stopAt):
+				calls.setdefault(self.callNames[j],[]).append((self.callStops[j]-shift,self.callParens[j]-shift))
+			if spanStop > start:
+				shift += spanStop-max(start,spanStart)
+				start = spanStop
+		return calls
+
+
+class Node(javascript.Node):
+	'''
+	calls are the TokenTable's in the source of this node. linksTo only searches the source around them
+	'''
+
+	__slots__ = ('calls',)
+
+	def __init__(self,calls=None,**kwargs):
+		self.calls = calls or {}
+		super(Node,self).__init__(**kwargs)
+
+	def findCallSites(self):
+		return frozenset(self.calls)
+
+	def linksTo(self,other):
+		'''
+		The same patterns as javascript.Node.linksTo but each is only searched for in front of the calls to the other node
+		Every match ends with the other node's name and the open paren and no pattern matches more characters than it has
+		, so a match begins at most len(pattern) before the end of the name
+
+		Names and namespaces which aren't plain (e.g. $ or a file named a+b.js) make patterns which match anywhere
+		or match more characters than they have. Those are searched for in the whole source like before
+		'''
+		if not identifierPattern.match(other.name) or unboundedPattern.search(other._getFullNamespace()):
+			return super(Node,self).linksTo(other)
+
+		windows = []
+		for callName,calls in self.calls.iteritems():
+			if callName.endswith(other.name):
+				windows += calls
+		if not windows:
+			return False
+
+		patterns = other.generateAnyScopePatterns()
+		if other.parent == self.parent:
+			patterns = other.sameScopePatterns+patterns
+
+		sourceString = self.source.sourceString
+		for pattern in patterns:
+			reach = len(pattern.pattern)
+			for nameStop,parenPos in windows:
+				if pattern.search(sourceString,max(0,nameStop-reach),parenPos+1):
+					return True
+		return False
+
+
+Edge = javascript.Edge
+
+
+class Group(javascript.Group):
+	'''
+	Blocks are recognized by the definitions in the TokenTable instead of by searching for the PATTERNS
+	'''
+
+	__slots__ = ()
+
+	def newGroupFromBlock(self,openBracket,closeBracket):
+		definition = self.source.tokenTable.definitions.get(self.source.start+openBracket)
+		if definition is None:
+			return None
+
+		definitionType,name,definitionPos = definition
+		if definitionPos < self.source.start:
+			return None
+
+		preBlockSource = self.source[:openBracket]
+		blockSource = self.source[openBracket:closeBracket+1]
+		return self.newGroupFromDefinition(preBlockSource,blockSource,definitionType,name,definitionPos-self.source.start)
+
+	def generateImplicitNode(self,blocksToRemove):
+		#The calls are those in the source outside of the 'spoken for' blocks
+		spans = sorted((block.fullSource.start,block.fullSource.stop) for block in blocksToRemove if block.fullSource)
+		calls = self.source.tokenTable.getCalls(self.source.start,self.source.stop,spans)
+		source = self.source.withoutSources([block.fullSource for block in blocksToRemove])
+
+		if self.parent:
+			isFileRoot = False
+			name = self.name
+		else:
+			isFileRoot = True
+			name = self._generateRootNodeName(self.name.rsplit('/',1)[-1])
+
+		return Node(name=name,source=source,definitionString=self.definitionString,parent=self,lineNumber=self.lineNumber,isFileRoot=isFileRoot,calls=calls)
+
+
+class SourceCode(javascript.SourceCode):
+	'''
+	tokenTable is filled in while the comments and literals are removed
+	Sources joined from pieces (see engine.py) get an empty one
+	'''
+
+	__slots__ = ('tokenTable',)
+
+	def __init__(self,sourceString,lineIndex=None,firstLine=1):
+		self.tokenTable = TokenTable()
+		super(SourceCode,self).__init__(sourceString,lineIndex,firstLine)
+
+	def _removeCommentsAndStrings(self):
+		'''
+		One pass of tokenize over the file:
+		a. The code is kept and each literal or comment is replaced by its delimiters, e.g. "abc" -> "" and /a+/g -> //
+		   Line comments are dropped. The expressions of a template literal are kept in parens, `a${b}c` -> `(b)`
+		b. The lineIndex is built like in engine.py
+		c. The '{' and '}' are paired into the bracket table
+		d. The calls and the definitions in front of the blocks go into the tokenTable
+
+		The code is copied in bulk up to each literal or comment. No placeholder is longer than what it replaces
+		so the cleaned source is never longer than the file
+		'''
+		print "Removing comments and strings..."
+
+		originalString = self.buffer
+		table = self.tokenTable
+		braces = BracketTable()
+
+		kept = bytearray(len(originalString))
+		#writing through a memoryview is a plain copy where bytearray's own slice assignment is not
+		keptView = memoryview(kept)
+		keptLen = 0
+		copied = 0 #everything in originalString before this has been kept or replaced
+		lineCount = 1
+		self.firstLine = lineCount #character 0 is line #1
+		lineCount += 1 #set up for next line which will be two
+
+		#(kind,text,start,stop) of the last tokens which are not comments. Literals have no text
+		recent = deque(maxlen=RECENT)
+		#the definition which each open paren would begin (see getFunctionDefinition)
+		parens = []
+		closedParenDefinition = None
+
+		#the last 'token' keeps the code after the last literal or comment
+		for kind,start,stop in itertools.chain(tokenize(originalString),[(None,len(originalString),len(originalString))]):
+			if kind in ('name','number','punct'):
+				keptStart = keptLen+start-copied
+				text = originalString[start:stop]
+
+				if kind == 'punct':
+					if text == '(':
+						if recent and recent[-1][0] == 'name':
+							table.callPositions.append(recent[-1][2])
+							table.callNames.append(recent[-1][1])
+							table.callStops.append(recent[-1][3])
+							table.callParens.append(keptStart)
+						parens.append(getFunctionDefinition(recent))
+					elif text == ')':
+						closedParenDefinition = parens.pop() if parens else None
+					elif text == '{':
+						braces.open(keptStart)
+						definition = None
+						if recent and recent[-1][1] == ')':
+							definition = closedParenDefinition
+						elif recent and recent[-1][1] == '=':
+							chain = getChainName(recent,-2)
+							if chain:
+								definition = 'object',chain[0],chain[1]
+						if definition:
+							table.definitions[keptStart] = definition
+					elif text == '}':
+						braces.close(keptStart)
+
+				recent.append((kind,text,keptStart,keptStart+stop-start))
+				continue
+
+			#keep everything up to the literal or comment, noting where each new line begins
+			newlinePos = originalString.find('\n',copied,start)
+			while newlinePos != -1:
+				self.lineIndex.append(keptLen+newlinePos-copied+1,lineCount)
+				lineCount += 1
+				newlinePos = originalString.find('\n',newlinePos+1,start)
+			keptView[keptLen:keptLen+start-copied] = originalString[copied:start]
+			keptLen += start-copied
+
+			if kind is None:
+				break
+
+			#still want to see the literals and block comments, just not what is inside
+			if kind in PLACEHOLDERS:
+				placeholder = PLACEHOLDERS[kind]
+			elif kind == 'comment':
+				placeholder = '/**/' if originalString[start+1] == '*' else ''
+			else:
+				placeholder = originalString[start]*2
+			#a literal or comment left open at the end of the file can be shorter than its delimiters
+			placeholder = placeholder[:stop-start]
+			keptView[keptLen:keptLen+len(placeholder)] = placeholder
+			if kind != 'comment':
+				recent.append(('literal',None,keptLen,keptLen+len(placeholder)))
+			keptLen += len(placeholder)
+
+			lineCount += originalString[start:stop].count('\n')
+			copied = stop
+
+		self.bracketIndex.setTable('{','}',braces)
+
+		#the view has to go before the bytearray can be resized
+		del keptView
+		del kept[keptLen:]
+		self.buffer = str(kept)
+
+
+class Mapper(javascript.Mapper):
+	def generateFileGroup(self,name,source):
+		return Group(name=name,source=source,fullSource=source,isFunction=True)
@@ -4,17 +4,185 @@ All of these classes subclass engine.py classes
 Functions that begin with an "_" are local and do not replace anything in engine.py
 '''
 
+from array import array
+from bisect import bisect_right
+
 from code2flowlib.engine import *
 
+patterns = patterns.extend({
+	'newObject':(r'%(name)s\s*\(',0),
+	'newObjectAssigned':(r'(\w)\s*=\s*%(name)s\s*\(',0),
+	'functionDefinition':(r"^%(namespace)sdef\s(\w+)\s*\(.*?\)\s*\:",re.MULTILINE|re.DOTALL),
+	})
+
 indentPattern = re.compile(r"^([\t ]*)\S",re.MULTILINE)
 def getIndent(colonPos,sourceString):
-	try:
-		return indentPattern.search(sourceString[colonPos:]).group(1)
-	except:
-		pdb.set_trace()
+	match = indentPattern.search(sourceString[colonPos:])
+	if match is None:
+		#nothing follows the colon, like in a file which is cut off while it is being edited
+		return ''
+	return match.group(1)
+
+class ImportTable(object):
+	'''
+	Every import statement in a file, so that calls into other files are resolved with dict lookups
+
+		modules: imported module -> the namespace it is used through (the module itself or its alias)
+		names: module -> {imported name: the name it is used through} for 'from module import name'
+		starModules: modules imported with 'from module import *'
+		aliasedNames: alias -> the names imported as it by 'from module import name as alias'
+
+	Modules are kept as written (e.g. '.sibling' for relative imports) and matched against Group.getImportPaths
+	Imports are found at any indentation so that those in functions and in try blocks count too
+	'''
+
+	#The rest of the statement can continue onto further lines with a backslash or, for from imports, with parentheses
+	importPattern = re.compile(r"^[\t ]*import[\t ]+((?:[^\n\\;]|\\\n)+)",re.MULTILINE)
+	fromImportPattern = re.compile(r"^[\t ]*from[\t ]+([\w\.]+)[\t ]+import[\t ]*(\([^\)]*\)|(?:[^\n\\;]|\\\n)+)",re.MULTILINE)
+	asPattern = re.compile(r"\s+as\s+")
+
+	def __init__(self,sourceString):
+		self.modules = {}
+		self.names = {}
+		self.starModules = set()
+		self.aliasedNames = {}
+
+		for match in self.importPattern.finditer(sourceString):
+			for module,alias in self._splitImportList(match.group(1)):
+				self.modules[module] = alias
+
+		for match in self.fromImportPattern.finditer(sourceString):
+			module = match.group(1)
+			for name,alias in self._splitImportList(match.group(2).strip('()')):
+				self._addName(module,name,alias)
+
+	def _addName(self,module,name,alias):
+		'''
+		Record 'from module import name as alias'. alias is name when there is no 'as'
+		'''
+		if name == '*':
+			self.starModules.add(module)
+			return
+		self.names.setdefault(module,{})[name] = alias
+		if alias != name:
+			self.aliasedNames.setdefault(alias,set()).add(name)
+
+	def _splitImportList(self,importList):
+		'''
+		Return (name,alias) for each 'name' or 'name as alias' in a comma separated list
+		'''
+		ret = []
+		for item in importList.replace('\\\n',' ').split(','):
+			item = item.strip()
+			if item:
+				parts = self.asPattern.split(item)
+				ret.append((parts[0],parts[-1]))
+		return ret
+
+	def resolve(self,importPaths,name):
+		'''
+		Return every (namespace,name) through which 'name' from the module imported by one of importPaths is called
+		The namespace is the module's namespace for 'import module' and '' for 'from module import name'
+		The name is the alias for 'from module import name as alias'
+		Returns an empty list if this file does not import it
+		'''
+		callNames = []
+		for importPath in importPaths:
+			if importPath in self.modules:
+				callNames.append((self.modules[importPath],name))
+			names = self.names.get(importPath,{})
+			if name in names:
+				callNames.append(('',names[name]))
+			elif importPath in self.starModules:
+				callNames.append(('',name))
+		return callNames
+
+	def getImportedCallSites(self,callSites):
+		'''
+		Add the imported names to the call sites which call them through an alias so that the call-site index finds them
+		'''
+		aliased = [self.aliasedNames[callSite] for callSite in callSites if callSite in self.aliasedNames]
+		if not aliased:
+			return callSites
+		return callSites.union(*aliased)
+
+class IndentTable(object):
+	'''
+	Every line of a file with its indentation so that finding the end of an indented block is a lookup
+	Built the first time it is asked for and shared by every slice of the file like the LineIndex
+
+		starts: where each line begins
+		leads: how many tabs and spaces each line begins with
+		kinds: BLANK (only whitespace), CODE (something follows the indentation) or OTHER
+		ends: for each CODE line, the first later line which is not blank and does not begin with this line's indentation. -1 if there is none
+
+	ends is worked out in one pass with a stack of the CODE lines whose block is still open
+	Each indentation on the stack begins with the one below it so a line closes blocks from the top of the stack down
+	'''
+
+	BLANK = 0
+	CODE = 1
+	OTHER = 2
+
+	__slots__ = ('starts','leads','kinds','ends')
+
+	def __init__(self):
+		self.starts = None
+
+	def __getstate__(self):
+		'''
+		The table is only needed while parsing. Don't pickle it with the file group
+		'''
+		return {'starts':None}
+
+	def __setstate__(self,state):
+		self.starts = state['starts']
+
+	def build(self,buffer):
+		if self.starts is not None:
+			return self
+
+		self.starts = array('i')
+		self.leads = array('i')
+		self.kinds = array('b')
+		self.ends = array('i')
+
+		stack = []
+		start = 0
+		for i,line in enumerate(buffer.split('\n')):
+			lead = len(line)-len(line.lstrip('\t '))
+			if not line.strip():
+				kind = self.BLANK
+			elif not line[lead].isspace():
+				kind = self.CODE
+			else:
+				kind = self.OTHER
+
+			self.starts.append(start)
+			self.leads.append(lead)
+			self.kinds.append(kind)
+			self.ends.append(-1)
+			start += len(line)+1
+
+			if kind == self.BLANK:
+				continue
+			indent = line[:lead]
+			while stack and not indent.startswith(stack[-1][1]):
+				self.ends[stack.pop()[0]] = i
+			if kind == self.CODE:
+				stack.append((i,indent))
+		return self
+
+	def getLine(self,pos):
+		'''
+		The line which pos is on
+		'''
+		return bisect_right(self.starts,pos)-1
 
 class Node(Node):
+	__slots__ = ()
 	sameScopeKeyword = 'self'
+	patterns = patterns
 	namespaceBeforeDotPattern = re.compile(r'(?:[^\w\.]|\A)([\w\.]+)\.$',re.MULTILINE)
 
 	def generateSameScopePatterns(self):
@@ -36,16 +204,27 @@ class Node(Node):
 		else:
 			self.isInitNode = False
 
+	def findCallSites(self):
+		'''
+		A call through the alias of an imported name might call the name
+		'''
+		return self._getFileGroup().importTable.getImportedCallSites(super(Node,self).findCallSites())
+
+	def getCallSiteNames(self):
+		'''
+		__init__ nodes are also called when their class is instantiated
+		'''
+		names = super(Node,self).getCallSiteNames()
+		if self.isInitNode:
+			names.append(self.parent.name)
+		return names
+
 	def isExtraneous(self,edges):
 		'''
 		Returns whether we can safely delete this node
 		'''
 		if self.isRoot():
-			for edge in edges:
-				if edge.node0 == self or edge.node1 == self:
-					return False
-			else:
-				return True
+			return not edges.hasNode(self)
 		return False
 
 	def isRoot(self):
@@ -56,36 +235,43 @@ class Node(Node):
 
 	def linksTo(self,other):
 
-		importNamespace = ''
+		#If this is in a different file, figure out what namespaces and names it is called through
+		fileGroup = self._getFileGroup()
+		if fileGroup == other._getFileGroup():
+			callNames = [('',other.name)]
+		else:
+			importPaths = other.parent.getImportPaths(fileGroup.name)
+			callNames = fileGroup.importTable.resolve(importPaths,other.name)
+			if not callNames:
+				return False
 
-		#If this is in a different file, figure out what namespace to use
-		if self._getFileGroup() != other._getFileGroup():
-			importPaths = other.parent.getImportPaths(self._getFileName())
+		for importNamespace,calledName in callNames:
+			pattern = other.pattern if calledName == other.name else self.patterns.get('name',calledName)
+			if self._callsThrough(other,importNamespace,pattern):
+				return True
 
-			for importPath in importPaths:
-				regularImport = re.compile(r"^import\s+%s\s*$"%re.escape(importPath),re.MULTILINE)
-				complexImport = re.compile('^from\s%s\simport\s(?:\*|(?:.*?\W%s\W.*?))\s*$'%(re.escape(importPath),re.escape(other.name)),re.MULTILINE)
-				#print importPath
-				#print self.parent._getFileGroup().name
-				if regularImport.search(self._getFileGroup().source.sourceString):
-					importNamespace += importPath
-					break
-				elif complexImport.search(self._getFileGroup().source.sourceString):
-					break
-			else:
-				return False
+		#TODO put in try in case isInitNode not defined
+		if other.isInitNode and other.parent.newObjectPattern.search(self.source.sourceString):
+			return True
+
+		return False
 
+	def _callsThrough(self,other,importNamespace,pattern):
+		'''
+		Whether the first match of pattern in this source is a call to other through importNamespace
+		'''
 		if not other.isRoot():
 			importNamespace = importNamespace + '.' + other.parent.name if importNamespace else other.parent.name
 
 		#If the naive functionName (e.g. \Wmyfunc\( ) appears anywhere in this sourceString, check whether it is actually THAT function
-		match = other.pattern.search(self.source.sourceString)
+		match = pattern.search(self.source.sourceString)
 		if match:
 			matchPos = match.start(1)
 			hasDot = self.source.sourceString[matchPos-1] == '.'
 
 			#if the other function is in the global namespace and this call is not referring to any namespace, return true
-			if other.isRoot() and not hasDot: #TODO js will require the 'window' namespace integrated somehow
+			#unless the name is only imported with its module
+			if other.isRoot() and not hasDot and not importNamespace: #TODO js will require the 'window' namespace integrated somehow
 				return True
 
 			#if the other is part of a namespace and we are looking for a namspace
@@ -114,22 +300,19 @@ class Node(Node):
 				if newObjectMatch and namespace == importNamespace + newObjectMatch.group(1):
 					return True
 
-
-		#TODO put in try in case isInitNode not defined
-		if other.isInitNode and other.parent.newObjectPattern.search(self.source.sourceString):
-			return True
-
 		return False
 
 class Edge(Edge):
-	pass
+	__slots__ = ()
 
 class Group(Group):
+	__slots__ = ('indent','importPaths','importTable')
 
 	classPattern = re.compile(r"^class\s(\w+)\s*(\(.*?\))?\s*\:",re.MULTILINE)
 	#implicitName = 'module'
 
 	globalFrameName = 'module'
+	patterns = patterns
 
 	def __init__(self,indent='',**kwargs):
 		'''
@@ -140,12 +323,19 @@ class Group(Group):
 		'''
 		self.indent = indent
 
+		#importer filename -> getImportPaths. Only used on file groups
+		self.importPaths = {}
+
 		super(Group,self).__init__(**kwargs)
 
 		#If this is the root node, set indent to nothing
 		#if not self.parent:
 		#	self.indent = ''
 
+		#the nodes of the file need its imports to find their call sites
+		if not self.parent:
+			self.importTable = self.generateImportTable()
+
 		#with the indent set, we can now generate nodes
 		self._generateNodes()
 
@@ -173,7 +363,7 @@ class Group(Group):
 		Return the regex for function definition at this indent level
 		'''
 		indent = self.indent.replace(' ',r'\s').replace('	',r'\t')
-		return [re.compile(r"^%sdef\s(\w+)\s*\(.*?\)\s*\:"%indent,re.MULTILINE|re.DOTALL)]
+		return [self.patterns.get('functionDefinition','',indent)]
 
 	def generateSubgroups(self):
 		classMatches = self.classPattern.finditer(self.source.sourceString)
@@ -181,18 +371,21 @@ class Group(Group):
 			name = classMatch.group(1)
 			definitionString = classMatch.group(0)
 			colonPos = classMatch.end(0)
-			indent = getIndent(colonPos=colonPos,sourceString=self.source.sourceString)
+			indent = self.source.getIndent(colonPos)
 			source = self.source.getSourceInBlock(colonPos=colonPos)
 			fullSource = self.source.getSourceInBlock(colonPos=colonPos,fullSource=True)
 			lineNumber = self.source.getLineNumber(colonPos)
 			classGroup = Group(name=name,definitionString=definitionString,indent=indent,source=source,fullSource=fullSource,parent=self,lineNumber=lineNumber)
 			self.subgroups.append(classGroup)
 
+	def generateImportTable(self):
+		return ImportTable(self.source.sourceString)
+
 	def generateNewObjectPattern(self):
-		return re.compile(r'%s\s*\('%self.name)
+		return self.patterns.get('newObject',self.name)
 
 	def generateNewObjectAssignedPattern(self):
-		return re.compile(r'(\w)\s*=\s*%s\s*\('%self.name)
+		return self.patterns.get('newObjectAssigned',self.name)
 
 	def generateRootNode(self):
 		name = self._generateRootNodeName()
@@ -204,29 +397,18 @@ class Group(Group):
 		Find all of the code not in any subnode, string it together, and return it as the implicit node
 		'''
 
-		source = self.source.copy()
-		for node in self.nodes:
-			source -= node.fullSource
-
-			#source =source.remove(node.definitionString)
-
-		for group in self.subgroups:
-			source -= group.fullSource
-			'''
-			source.remove(group.source.sourceString)
-			if group.definitionString:
-				#print group.definitionString
-
-				source = source.remove(group.definitionString)
-			'''
-		return source
+		fullSources = [node.fullSource for node in self.nodes]+[group.fullSource for group in self.subgroups]
+		return self.source.withoutSources(fullSources)
 
 	def getImportPaths(self,importerFilename):
 		'''
 		Return the relative and absolute paths the other filename would use to import this module
+		These only depend on the two filenames so they are worked out once per importer and kept on the file group
 		'''
-		paths = self._getRelativeImportPaths(importerFilename)+self._getAbsoluteImportPaths()
-		return paths
+		importPaths = self._getFileGroup().importPaths
+		if importerFilename not in importPaths:
+			importPaths[importerFilename] = self._getRelativeImportPaths(importerFilename)+self._getAbsoluteImportPaths()
+		return importPaths[importerFilename]
 
 
 	def _getRelativeImportPaths(self,importerFilename):
@@ -302,6 +484,7 @@ class Group(Group):
 
 
 class SourceCode(SourceCode):
+	__slots__ = ('indentTable',)
 	blockComments = [
 		{'start':'"','end':'"'}
 		,{'start':"'",'end':"'"}
@@ -310,34 +493,124 @@ class SourceCode(SourceCode):
 		]
 	inlineComments = "#"
 
+	def __init__(self,*args,**kwargs):
+		super(SourceCode,self).__init__(*args,**kwargs)
+		self.indentTable = IndentTable()
+
+	def getIndent(self,colonPos):
+		'''
+		The indentation of the block after colonPos. Same as getIndent(colonPos,self.sourceString)
+		'''
+		indent,indentLine = self._findIndent(colonPos)
+		if indent is None:
+			return getIndent(colonPos,self.sourceString)
+		return indent
+
 	def getSourceInBlock(self,colonPos,fullSource=False):
 		'''
 		Overwrites superclass method
 		'''
-		indent = getIndent(colonPos,self.sourceString)
-
-		endPos = colonPos
-
-		lines = self.sourceString[colonPos:].split('\n')[1:]
-		for line in lines:
-			if line.startswith(indent) or line.strip()=='':
-				endPos += len(line)+1 #+1 for the newlines lost
-			else:
-				break
+		endPos = self._getBlockEnd(colonPos)
 
 		if fullSource:
-			startPos = self.sourceString.rfind('\n',0,colonPos)
+			startPos = self.buffer.rfind('\n',self.start,self.start+colonPos)
 			if startPos == -1:
 				startPos = 0
 			else:
-				startPos += 1
+				startPos += 1-self.start
 		else:
-			startPos = colonPos+1
+			#a colon at the very end of the source has an empty block
+			startPos = min(colonPos+1,endPos)
 		try:
 			return self[startPos:endPos]
 		except:
 			pdb.set_trace()
 
+	def _findIndent(self,colonPos):
+		'''
+		Return the indentation of the block after colonPos and the line it was found on
+		That is either what follows the colon if there is code on the same line (and None for the line)
+		, or the indentation of the first line of code after it
+
+		Returns None,None if the last line of this source would have to be looked at.
+		It might be cut short by the end of the source so the table can't be trusted for it
+		'''
+		table = self.indentTable.build(self.buffer)
+		colon = self.start+colonPos
+		newline = self.buffer.find('\n',colon,self.stop)
+		if newline == -1:
+			return None,None
+
+		#code on the same line as the colon
+		i = colon
+		while self.buffer[i] in '\t ':
+			i += 1
+		if i < newline and not self.buffer[i].isspace():
+			return self.buffer[colon:i],None
+
+		lastLine = table.getLine(self.stop)
+		line = table.getLine(newline+1)
+		while line < lastLine:
+			if table.kinds[line] == table.CODE:
+				start = table.starts[line]
+				return self.buffer[start:start+table.leads[line]],line
+			line += 1
+		return None,None
+
+	def _getBlockEnd(self,colonPos):
+		'''
+		The block is every line after the colon which is blank or begins with the block's indentation
+
+		For historical reasons, the end is counted from colonPos rather than from the end of the colon's line
+		The lengths of the lines in the block are added to colonPos, so the block stops short of the line which ends it
+		by however much followed the colon on its line (see _getBlockEndByLines)
+		'''
+		indent,indentLine = self._findIndent(colonPos)
+		if indent is None:
+			return self._getBlockEndByLines(colonPos)
+
+		table = self.indentTable
+		colon = self.start+colonPos
+		firstLine = table.getLine(self.buffer.find('\n',colon,self.stop)+1)
+		lastLine = table.getLine(self.stop)
+
+		endLine = -1
+		if indentLine is None:
+			#code after the colon. Check each line for the indentation
+			line = firstLine
+			while line < lastLine:
+				start = table.starts[line]
+				if table.kinds[line] != table.BLANK and self.buffer[start:start+len(indent)] != indent:
+					endLine = line
+					break
+				line += 1
+		else:
+			#lines between the colon and the first line of code are blank unless something odd (e.g. a form feed) is in there
+			if any(table.kinds[line] == table.OTHER for line in xrange(firstLine,indentLine)):
+				return self._getBlockEndByLines(colonPos)
+			endLine = table.ends[indentLine]
+
+		#the last line of the source is only seen in full by _getBlockEndByLines
+		if endLine == -1 or endLine >= lastLine:
+			return self._getBlockEndByLines(colonPos)
+		return colonPos+table.starts[endLine]-table.starts[firstLine]
+
+	def _getBlockEndByLines(self,colonPos):
+		'''
+		Split the rest of the source into lines and walk them until one is not in the block
+		'''
+		indent = getIndent(colonPos,self.sourceString)
+
+		endPos = colonPos
+
+		lines = self.sourceString[colonPos:].split('\n')[1:]
+		for line in lines:
+			if line.startswith(indent) or line.strip()=='':
+				endPos += len(line)+1 #+1 for the newlines lost
+			else:
+				break
+		return endPos
+
 
 class Mapper(Mapper):
 
@@ -0,0 +1,323 @@
+'''
+A python front end built on the standard ast module. Selected with --parser ast
+
+python.py strips the comments and strings out of a file, finds the definitions of every group with a regex
+, works out where each block ends from the indentation and then, for edges, searches the source of every node for each name it might call.
+Here, one ast.parse of the file gives all of that: the definitions and how they nest, every call expression, every return and every import.
+No SourceCode is made at all. The Group/Node/Edge model is python.py's so edges, trimming, the cache, dotgenerator and export
+don't know the difference. Nodes and groups just have no source (which also makes the parse cache much smaller)
+
+What is different from the regex front end:
+	- definitions inside of if/try/with/for/while blocks at the module and class level are found
+	- a node's calls are the call expressions in its body. linksTo checks every call to the other node rather than the first text match
+	  , and nested definitions, keywords (e.g. print (x)) and class statements are never mistaken for calls
+	- after 'a = MyClass()', a.method() links to MyClass.method
+	- decorators, default arguments and base classes are called by the frame the definition is in (e.g. the module)
+
+Files which ast can't parse (e.g. python 3 only syntax) fall back to the regex front end
+'''
+
+import ast
+
+import code2flowlib.languages.python as python
+from code2flowlib.engine import *
+
+#the fields of compound statements (and except clauses) which hold more statements
+BLOCK_FIELDS = ('body','orelse','handlers','finalbody')
+
+
+def iterDefinitions(statements):
+	'''
+	Yield the function and class definitions among statements in order, including those inside of if/try/with/for/while blocks
+	Definitions are not looked inside of
+	'''
+	for statement in statements:
+		if isinstance(statement,(ast.FunctionDef,ast.ClassDef)):
+			yield statement
+			continue
+		for field in BLOCK_FIELDS:
+			for definition in iterDefinitions(getattr(statement,field,())):
+				yield definition
+
+def getDottedName(node):
+	'''
+	'a.b' for the expression a.b. None if the expression is anything other than names and attributes
+	'''
+	if isinstance(node,ast.Name):
+		return node.id
+	if isinstance(node,ast.Attribute):
+		namespace = getDottedName(node.value)
+		if namespace is not None:
+			return namespace+'.'+node.attr
+	return None
+
+def getCallName(func):
+	'''
+	Return (namespace,name) for what a call expression calls
+		name() -> ('',name)
+		a.b.name() -> ('a.b',name)
+		a[0].name() -> (None,name)
+	None if what is called has no name (e.g. f()())
+	'''
+	if isinstance(func,ast.Name):
+		return '',func.id
+	if isinstance(func,ast.Attribute):
+		return getDottedName(func.value),func.attr
+	return None
+
+
+class ImportTable(python.ImportTable):
+	'''
+	The import table (see python.py) filled from ast import statements rather than from regexes
+	Relative modules are written the same way, e.g. '..sibling'
+	'''
+
+	def __init__(self):
+		self.modules = {}
+		self.names = {}
+		self.starModules = set()
+		self.aliasedNames = {}
+
+	def add(self,statement):
+		if isinstance(statement,ast.Import):
+			for alias in statement.names:
+				self.modules[alias.name] = alias.asname or alias.name
+			return
+
+		module = '.'*(statement.level or 0)+(statement.module or '')
+		for alias in statement.names:
+			self._addName(module,alias.name,alias.asname or alias.name)
+
+
+class FileTree(object):
+	'''
+	Everything the front end needs from the ast of a file, from one walk over it
+
+		module: the ast.Module
+		definitions: the definitions which become groups and nodes. Functions and classes at the module level and functions at the class level
+		calls: function definition (or the module for the module frame) -> frozenset of (namespace,name) of its calls (see getCallName)
+		newObjects: function definition (or the module) -> frozenset of (variable,name) for each 'variable = name(...)'
+		returns: the function definitions with a return statement
+		importTable: every import statement in the file
+
+	A call belongs to the innermost of the definitions it is in. Calls in the decorators, default arguments and base classes
+	of a definition run in the frame around it so they belong to that. Calls at the class level belong to nothing, like in python.py
+	'''
+
+	#the line a decorated definition is actually on
+	definitionLinePattern = re.compile(r"\s*(?:def|class)\s")
+
+	def __init__(self,module,fileString):
+		self.module = module
+		self.fileString = fileString
+		self.lines = None
+
+		self.definitions = set()
+		for definition in iterDefinitions(module.body):
+			self.definitions.add(definition)
+			if isinstance(definition,ast.ClassDef):
+				for method in iterDefinitions(definition.body):
+					if isinstance(method,ast.FunctionDef):
+						self.definitions.add(method)
+
+		self.importTable = ImportTable()
+		self.returns = set()
+		calls = {module:set()}
+		newObjects = {module:set()}
+
+		stack = [(statement,module) for statement in module.body]
+		while stack:
+			node,owner = stack.pop()
+
+			if node in self.definitions:
+				if isinstance(node,ast.FunctionDef):
+					stack.extend((child,owner) for child in node.decorator_list+node.args.defaults)
+					owner = node
+					calls[owner] = set()
+					newObjects[owner] = set()
+				else:
+					stack.extend((child,owner) for child in node.decorator_list+node.bases)
+					owner = None
+				stack.extend((statement,owner) for statement in node.body)
+				continue
+
+			if isinstance(node,ast.Call):
+				call = getCallName(node.func)
+				if call and owner is not None:
+					calls[owner].add(call)
+			elif isinstance(node,ast.Assign):
+				if isinstance(node.value,ast.Call) and owner is not None:
+					call = getCallName(node.value.func)
+					if call:
+						for target in node.targets:
+							if isinstance(target,ast.Name):
+								newObjects[owner].add((target.id,call[1]))
+			elif isinstance(node,ast.Return):
+				self.returns.add(owner)
+			elif isinstance(node,(ast.Import,ast.ImportFrom)):
+				self.importTable.add(node)
+
+			#like ast.iter_child_nodes but without the expression contexts (Load, Store...) which are on every name
+			for field in node._fields:
+				value = getattr(node,field,None)
+				if isinstance(value,list):
+					for child in value:
+						if isinstance(child,ast.AST):
+							stack.append((child,owner))
+				elif isinstance(value,ast.AST) and field != 'ctx':
+					stack.append((value,owner))
+
+		self.calls = dict((owner,frozenset(ownerCalls)) for owner,ownerCalls in calls.iteritems())
+		self.newObjects = dict((owner,frozenset(ownerObjects)) for owner,ownerObjects in newObjects.iteritems())
+
+	def getLineNumber(self,definition):
+		'''
+		The line the def or class is on. For a decorated definition, ast's lineno is the line of the first decorator
+		'''
+		if not definition.decorator_list:
+			return definition.lineno
+
+		if self.lines is None:
+			self.lines = self.fileString.split('\n')
+		for lineNumber in xrange(definition.decorator_list[-1].lineno,len(self.lines)+1):
+			if self.definitionLinePattern.match(self.lines[lineNumber-1]):
+				return lineNumber
+		return definition.lineno
+
+
+class Node(python.Node):
+	'''
+	calls and newObjects are the definition's in the FileTree. There is no source
+	'''
+
+	__slots__ = ('calls','newObjects')
+
+	def __init__(self,calls=frozenset(),newObjects=frozenset(),returns=False,**kwargs):
+		self.calls = calls
+		self.newObjects = newObjects
+		self.returns = returns
+		super(Node,self).__init__(source=None,**kwargs)
+
+	def findReturns(self):
+		return self.returns
+
+	def findCallSites(self):
+		callSites = frozenset(name for namespace,name in self.calls)
+		return self._getFileGroup().importTable.getImportedCallSites(callSites)
+
+	def linksTo(self,other):
+		'''
+		The same rules as python.Node.linksTo checked against every call to the other node
+		'''
+		#nothing else can match so don't bother resolving the imports
+		if other.name not in self.callSites and not (other.isInitNode and other.parent.name in self.callSites):
+			return False
+
+		#If this is in a different file, figure out what namespaces and names it is called through
+		fileGroup = self._getFileGroup()
+		if fileGroup == other._getFileGroup():
+			callNames = [('',other.name)]
+		else:
+			importPaths = other.parent.getImportPaths(fileGroup.name)
+			callNames = fileGroup.importTable.resolve(importPaths,other.name)
+			if not callNames:
+				return False
+
+		for importNamespace,calledName in callNames:
+			if not other.isRoot():
+				importNamespace = importNamespace + '.' + other.parent.name if importNamespace else other.parent.name
+
+			for namespace,name in self.calls:
+				#instantiating the class calls __init__
+				if other.isInitNode and name == other.parent.name:
+					return True
+
+				if name != calledName:
+					continue
+
+				if namespace == '':
+					if other.isRoot() and not importNamespace:
+						return True
+				elif namespace == importNamespace:
+					return True
+				elif namespace == self.sameScopeKeyword and other.parent == self.parent:
+					return True
+				elif not other.isRoot() and (namespace,other.parent.name) in self.newObjects:
+					return True
+
+		return False
+
+
+Edge = python.Edge
+
+
+class Group(python.Group):
+	'''
+	tree is the FileTree of the file and statements are those of the module or of the class body
+	Both are only kept while the group is generated
+	'''
+
+	__slots__ = ('tree','statements')
+
+	def __init__(self,tree=None,statements=(),**kwargs):
+		self.tree = tree
+		self.statements = statements
+		super(Group,self).__init__(source=None,**kwargs)
+		self.tree = None
+		self.statements = None
+
+	def _generateNodes(self):
+		for definition in iterDefinitions(self.statements):
+			if isinstance(definition,ast.FunctionDef):
+				self.nodes.append(self.generateNode(definition))
+
+	def generateSubgroups(self):
+		for definition in iterDefinitions(self.statements):
+			if isinstance(definition,ast.ClassDef):
+				lineNumber = self.tree.getLineNumber(definition)
+				classGroup = Group(tree=self.tree,statements=definition.body,name=definition.name,parent=self,lineNumber=lineNumber)
+				self.subgroups.append(classGroup)
+
+	def generateImportTable(self):
+		return self.tree.importTable
+
+	def generateRootNode(self):
+		name = self._generateRootNodeName()
+		module = self.tree.module
+		return Node(name=name,definitionString=None,parent=self,calls=self.tree.calls[module],newObjects=self.tree.newObjects[module],returns=module in self.tree.returns)
+
+	def generateNode(self,definition):
+		lineNumber = self.tree.getLineNumber(definition)
+		return Node(name=definition.name,definitionString=None,parent=self,lineNumber=lineNumber
+			,calls=self.tree.calls[definition],newObjects=self.tree.newObjects[definition],returns=definition in self.tree.returns)
+
+
+SourceCode = python.SourceCode
+
+
+class Mapper(python.Mapper):
+
+	def parseFile(self,filename,fileString):
+		'''
+		Generate the file group from the ast of the file. Only files which don't parse are made into SourceCode (see python.py)
+		'''
+		with profiler.phase('parseTree',filename):
+			try:
+				#an mmap (see readSource) has to be read into a string to be parsed
+				fileString = fileString[:]
+				module = ast.parse(fileString,filename)
+			except (SyntaxError,TypeError) as e:
+				print "Could not parse %s (%s). Falling back to the regex parser"%(filename,e)
+				return super(Mapper,self).parseFile(filename,fileString)
+
+		name = self.simpleFilename(filename)
+		print "Mapping %s"%name
+
+		print "Generating function nodes..."
+		with profiler.phase('generateGroups',filename):
+			return self.generateFileGroup(name=name,tree=FileTree(module,fileString))
+
+	def generateFileGroup(self,name,source=None,tree=None):
+		if tree is None:
+			return super(Mapper,self).generateFileGroup(name=name,source=source)
+		return Group(tree=tree,statements=tree.module.body,name=name,indent='')
@@ -0,0 +1,38 @@
+'''
+The line number index behind SourceCode
+'''
+
+from array import array
+from bisect import bisect_right
+
+
+class LineIndex(object):
+	'''
+	Two parallel arrays:
+		offsets: sorted character positions where a line begins
+		lineNumbers: the line number of each of those lines in the original file
+
+	Line numbers are not contiguous because comments and strings spanning several lines are removed
+
+	An index is never changed once it is built so that every slice of a file can share it
+	Slices only keep the range of entries (lo,hi) which fall inside of them
+	'''
+
+	__slots__ = ('offsets','lineNumbers')
+
+	def __init__(self):
+		self.offsets = array('i')
+		self.lineNumbers = array('i')
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def append(self,offset,lineNumber):
+		self.offsets.append(offset)
+		self.lineNumbers.append(lineNumber)
+
+	def bisect(self,offset,lo,hi):
+		'''
+		Return the position of the first entry after 'offset' between lo and hi
+		'''
+		return bisect_right(self.offsets,offset,lo,hi)
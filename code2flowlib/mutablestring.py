@@ -1,23 +1,54 @@
+'''
+A mutable string for building and editing large sources
+
+The text is held in one bytearray so it costs a byte per character. Appending and extending are amortised O(1)
+and spans of another string are copied in bulk with extend. The str is only built when something asks for it
+and is kept until the next change.
+
+SourceCode._join builds the buffers of joined sources with it
+'''
+
+
 class MString(object):
-	def __init__(self, char):
-		self.chars = list(char)
+	__slots__ = ('chars','_string')
+
+	def __init__(self, char=''):
+		self.chars = bytearray(char)
+		self._string = None
+	def __str__(self):
+		if self._string is None:
+			self._string = str(self.chars)
+		return self._string
 	def __repr__(self):
-		return "".join(self.chars)
+		return str(self)
 	def __setitem__(self, index, char):
 		self.chars[index] = char
+		self._string = None
 	def __getitem__(self, index):
 		if type(index) == slice:
-			return "".join(self.chars[index])
-		return self.chars[index]
+			return str(self.chars[index])
+		return chr(self.chars[index])
 	def __delitem__(self, index):
 		del self.chars[index]
+		self._string = None
 	def __add__(self, other):
-		raise NotImplementedError
+		ret = MString(self.chars)
+		ret.append(str(other))
+		return ret
 	def __len__(self):
 		return len(self.chars)
 	def append(self,other):
-		self.chars.append(other)
+		self.chars += other
+		self._string = None
+	def extend(self,other,start=0,stop=None):
+		'''
+		Append other[start:stop] without slicing other first
+		'''
+		if stop is None:
+			stop = len(other)
+		self.chars += buffer(other,start,stop-start)
+		self._string = None
 	def strip(self):
 		return str(self).strip()
 	def find(self,what,startAt=0):
-		return str(self).find(what,startAt)
\ No newline at end of file
+		return self.chars.find(what,startAt)
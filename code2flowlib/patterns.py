@@ -0,0 +1,48 @@
+'''
+Memoized regexes for finding calls to nodes and groups
+
+Every node and group needs a few patterns built from its name (e.g. how a call to it looks)
+and linksTo needs them again for every pair of nodes it checks.
+Compiling those over and over is slow and re's own cache is far too small to hold them for a whole project.
+So each pattern is compiled once, the first time it is asked for, and kept by (kind,name,namespace).
+'''
+
+import re
+
+
+class PatternFactory(object):
+	'''
+	templates maps each kind of pattern to (template,flags)
+	Templates are filled in with name, namespace, fullName (namespace.name) and re.escape'd escapedName and escapedNamespace
+	'''
+
+	def __init__(self,templates):
+		self.templates = templates
+		self.patterns = {}
+
+	def extend(self,templates):
+		'''
+		Return a new factory with these templates added. Each language adds its own on top of engine.py's
+		'''
+		allTemplates = dict(self.templates)
+		allTemplates.update(templates)
+		return PatternFactory(allTemplates)
+
+	def get(self,kind,name,namespace=''):
+		key = (kind,name,namespace)
+		try:
+			return self.patterns[key]
+		except KeyError:
+			pass
+
+		template,flags = self.templates[kind]
+		pattern = re.compile(template%{
+			'name':name,
+			'namespace':namespace,
+			'fullName':namespace+'.'+name if namespace else name,
+			'escapedName':re.escape(name),
+			'escapedNamespace':re.escape(namespace),
+			},flags)
+		self.patterns[key] = pattern
+		return pattern
+
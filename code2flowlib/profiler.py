@@ -0,0 +1,197 @@
+'''
+Phase timings for --profile
+
+The engine and the script wrap each phase of a run (reading, comment stripping, group/node generation, trimming,
+edge generation, DOT generation, rendering) in a phase:
+
+	with profiler.phase('stripComments',filename):
+		...
+
+Which is a no-op unless profiling was started. When it was, every phase records its wall time, CPU time
+and the peak memory (RSS) of the process so far. The report sums these per phase and per file.
+
+Files parsed in worker processes (--jobs) are timed in the worker and the records are sent back with the file group.
+The optional cProfile dump only covers the main process.
+'''
+
+import cProfile
+import json
+import sys
+import time
+
+try:
+	import resource
+except ImportError:
+	#windows
+	resource = None
+
+#The profiler of this run or None when not profiling
+_profiler = None
+
+
+def getCPUTime():
+	if resource:
+		usage = resource.getrusage(resource.RUSAGE_SELF)
+		return usage.ru_utime+usage.ru_stime
+	return time.clock()
+
+def getPeakRSS():
+	'''
+	Peak resident memory of this process in KB. 0 where we can't tell
+	'''
+	if not resource:
+		return 0
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == 'darwin':
+		#bytes on os.x, KB everywhere else
+		peak /= 1024
+	return peak
+
+
+def start(statsFile=None):
+	'''
+	Start profiling this run. With statsFile, cProfile runs as well and is dumped there by stop()
+	'''
+	global _profiler
+	_profiler = Profiler(statsFile)
+	return _profiler
+
+def stop():
+	'''
+	Stop profiling and return the profiler so that the report can be written
+	'''
+	global _profiler
+	profiler,_profiler = _profiler,None
+	if profiler:
+		profiler.stop()
+	return profiler
+
+def isEnabled():
+	return _profiler is not None
+
+def phase(name,filename=None):
+	if _profiler:
+		return Phase(_profiler,name,filename)
+	return _noPhase
+
+def takeRecords():
+	'''
+	Return and forget the records so far. Used to send the records of a worker process back
+	'''
+	if _profiler:
+		return _profiler.takeRecords()
+	return []
+
+def addRecords(records):
+	'''
+	Add records from a worker process
+	'''
+	if _profiler:
+		_profiler.records += records
+
+
+class Phase(object):
+	'''
+	Context manager which adds a record (name,filename,wall,cpu,peakRSS) to the profiler
+	'''
+
+	__slots__ = ('profiler','name','filename','startWall','startCPU')
+
+	def __init__(self,profiler,name,filename):
+		self.profiler = profiler
+		self.name = name
+		self.filename = filename
+
+	def __enter__(self):
+		self.startWall = time.time()
+		self.startCPU = getCPUTime()
+		return self
+
+	def __exit__(self,*exc):
+		self.profiler.records.append((self.name,self.filename,time.time()-self.startWall,getCPUTime()-self.startCPU,getPeakRSS()))
+
+
+class _NoPhase(object):
+	def __enter__(self):
+		return self
+
+	def __exit__(self,*exc):
+		pass
+
+_noPhase = _NoPhase()
+
+
+class Profiler(object):
+	def __init__(self,statsFile=None):
+		self.records = []
+		self.statsFile = statsFile
+		self.startWall = time.time()
+		self.startCPU = getCPUTime()
+		self.endWall = self.endCPU = None
+
+		self.cProfile = None
+		if statsFile:
+			self.cProfile = cProfile.Profile()
+			self.cProfile.enable()
+
+	def takeRecords(self):
+		records,self.records = self.records,[]
+		return records
+
+	def stop(self):
+		self.endWall = time.time()
+		self.endCPU = getCPUTime()
+		if self.cProfile:
+			self.cProfile.disable()
+			self.cProfile.dump_stats(self.statsFile)
+
+	def getReport(self):
+		'''
+		Return the totals as a dict:
+			total: wall and CPU time of the whole run and the peak memory
+			phases: phase -> wall, cpu, calls and peak memory at the end of the phase
+			files: filename -> phase -> wall and cpu
+
+		Phases run in worker processes add up to more wall time than the run took
+		'''
+		phases = {}
+		files = {}
+		for name,filename,wall,cpu,peakRSS in self.records:
+			totals = phases.setdefault(name,{'wall':0.0,'cpu':0.0,'calls':0,'peakRSSKB':0})
+			totals['wall'] += wall
+			totals['cpu'] += cpu
+			totals['calls'] += 1
+			totals['peakRSSKB'] = max(totals['peakRSSKB'],peakRSS)
+
+			if filename:
+				fileTotals = files.setdefault(filename,{}).setdefault(name,{'wall':0.0,'cpu':0.0})
+				fileTotals['wall'] += wall
+				fileTotals['cpu'] += cpu
+
+		endWall = self.endWall or time.time()
+		endCPU = self.endCPU or getCPUTime()
+		return {
+			'total':{'wall':endWall-self.startWall,'cpu':endCPU-self.startCPU,'peakRSSKB':getPeakRSS()},
+			'phases':phases,
+			'files':files,
+			}
+
+	def writeReport(self,filename):
+		with open(filename,'w') as outfile:
+			json.dump(self.getReport(),outfile,indent=1,sort_keys=True)
+
+	def getSummary(self):
+		'''
+		A few lines for the terminal: each phase from slowest to fastest, then the slowest files
+		'''
+		report = self.getReport()
+		lines = ['%-16s %9s %9s %6s %10s'%('phase','wall(s)','cpu(s)','calls','peak(KB)')]
+		for name,totals in sorted(report['phases'].items(),key=lambda item: -item[1]['wall']):
+			lines.append('%-16s %9.3f %9.3f %6d %10d'%(name,totals['wall'],totals['cpu'],totals['calls'],totals['peakRSSKB']))
+		total = report['total']
+		lines.append('%-16s %9.3f %9.3f %6s %10d'%('total',total['wall'],total['cpu'],'',total['peakRSSKB']))
+
+		fileWalls = [(sum(totals['wall'] for totals in phases.values()),filename) for filename,phases in report['files'].items()]
+		for wall,filename in sorted(fileWalls,reverse=True)[:5]:
+			lines.append('%9.3fs %s'%(wall,filename))
+		return '\n'.join(lines)
@@ -0,0 +1,96 @@
+'''
+Render the DOT file to images with graphviz
+
+The DOT fragments (see dotgenerator.iterDotFile) are piped straight into dot. There is no shell and dot doesn't
+have to read the file back from disk. Every requested format is written by that one dot process
+(dot -Tsvg -oout.svg -Tpng -oout.png) so the layout, which is most of the time, is only done once.
+
+dot lays out a graph only once its input is closed so there is one dot process per render rather than one for the whole run.
+Instead, renders are skipped altogether when the DOT file has not changed:
+	- the Renderer remembers the hash of what it last wrote to each file (e.g. in --watch mode)
+	- with a RenderCache (see cache.py), images are copied out of the cache when the same DOT file was rendered before
+'''
+
+import errno
+import hashlib
+import os
+import subprocess
+
+
+def getFormat(filename):
+	'''
+	The graphviz output format is the file extension
+	'''
+	return filename.rsplit('.',1)[1]
+
+
+class Renderer(object):
+	'''
+	Renders DOT fragments to any number of image files
+	'''
+
+	def __init__(self,program='dot',cache=None):
+		self.program = program
+		self.cache = cache
+
+		#image filename -> key of what this renderer last wrote to it
+		self.lastKeys = {}
+
+	def getKey(self,fragments):
+		hasher = hashlib.sha1()
+		hasher.update(self.program)
+		hasher.update('\0')
+		for fragment in fragments:
+			hasher.update(fragment)
+		return hasher.hexdigest()
+
+	def render(self,iterDot,filenames):
+		'''
+		iterDot is called for a fresh iterator over the DOT fragments each time they are needed
+		The first pass only hashes them. They are only generated again if dot actually has to run
+
+		Returns the filenames which dot rendered. The others were already up to date or came from the cache
+		'''
+		key = self.getKey(iterDot())
+
+		toRender = []
+		for filename in filenames:
+			if self.lastKeys.get(filename) == key and os.path.exists(filename):
+				continue
+			if self.cache and self.cache.get(key,getFormat(filename),filename):
+				self.lastKeys[filename] = key
+				continue
+			toRender.append(filename)
+
+		if not toRender:
+			return toRender
+
+		self._runDot(iterDot(),toRender)
+
+		for filename in toRender:
+			self.lastKeys[filename] = key
+			if self.cache:
+				self.cache.put(key,getFormat(filename),filename)
+		if self.cache:
+			self.cache.evict()
+		return toRender
+
+	def _runDot(self,fragments,filenames):
+		'''
+		Pipe the fragments into one dot process which writes every one of the files
+		'''
+		command = [self.program]
+		for filename in filenames:
+			command += ['-T'+getFormat(filename),'-o'+filename]
+
+		process = subprocess.Popen(command,stdin=subprocess.PIPE)
+		try:
+			process.stdin.writelines(fragments)
+			process.stdin.close()
+		except IOError as e:
+			#dot exited early. Its exit status says why
+			if e.errno != errno.EPIPE:
+				raise
+
+		if process.wait():
+			raise subprocess.CalledProcessError(process.returncode,' '.join(command))
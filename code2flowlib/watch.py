@@ -0,0 +1,283 @@
+'''
+Watch the source files for changes so that the flowchart can be regenerated as you work
+
+On linux, this uses inotify (through ctypes so nothing needs to be installed)
+Everywhere else, or if inotify is not available, we fall back to polling the files
+
+Directories are watched rather than the files themselves.
+Most editors save by writing a new file and moving it over the old one which would lose a watch on the file.
+Every directory the walk went into is watched and directories created later are added as they appear.
+Whether a new file is mapped is decided by the same rules as the walk (see ingest.SourceDirectory).
+
+Changes come in bursts (saving several files, git checkout, etc.) so wait() only returns
+once no further change has happened for 'debounce' seconds.
+'''
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+#inotify event masks from <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+
+
+def getWatcher(files,sourceDirectories,debounce=0.2,interval=1.0):
+	'''
+	Return an inotify watcher if we can or a polling watcher if we can't
+	'''
+	try:
+		return InotifyWatcher(files,sourceDirectories,debounce)
+	except (OSError,AttributeError):
+		return PollingWatcher(files,sourceDirectories,debounce,interval)
+
+
+class Watcher(object):
+	'''
+	Keeps track of which paths we care about. Subclassed by the inotify and polling watchers
+
+	files are the files passed on the command line and those which were mapped
+	sourceDirectories are the ingest.SourceDirectory of each directory passed on the command line
+	Every directory they walk into is watched, including those created later
+	, and a new file in one of them is mapped if the walk would have mapped it
+	'''
+
+	def __init__(self,files,sourceDirectories,debounce):
+		self.debounce = debounce
+
+		#normalized path -> path as the mapper knows it so that changes are reported that way
+		self.files = {}
+		for path in files:
+			self.files[os.path.normpath(path)] = path
+
+		#normalized directory -> (the SourceDirectory it is under,the directory the way the walk names it)
+		self.sourceDirectories = {}
+		for sourceDirectory in sourceDirectories:
+			for directory in sourceDirectory.iterDirectories():
+				self.sourceDirectories[os.path.normpath(directory)] = (sourceDirectory,directory)
+
+		self.directories = set(self.sourceDirectories)
+		for path in self.files:
+			self.directories.add(os.path.dirname(path) or '.')
+
+	def wait(self):
+		'''
+		Block until something changes, then keep collecting changes until things are quiet for 'debounce' seconds
+		Returns the set of changed paths
+		'''
+		changed = self._waitForChanges(None)
+		while True:
+			more = self._waitForChanges(self.debounce)
+			if more is None:
+				return changed
+			changed |= more
+
+	def _getChangedPaths(self,path):
+		'''
+		Return the set of paths, the way the mapper knows them, which a change to path means have changed
+
+		A new directory we would walk into is watched from now on and the files already in it are new
+		A watched directory which is gone takes the files we know in it with it
+		'''
+		path = os.path.normpath(path)
+		if path in self.files:
+			return set([self.files[path]])
+
+		directory,name = os.path.split(path)
+		directory = directory or '.'
+		if directory not in self.sourceDirectories:
+			return set()
+		sourceDirectory,walkedDirectory = self.sourceDirectories[directory]
+		walkedPath = os.path.join(walkedDirectory,name)
+
+		if name == '.gitignore':
+			sourceDirectory.forgetGitignores()
+			return set()
+
+		if os.path.isdir(path):
+			if path in self.sourceDirectories or not sourceDirectory.isWalkedDirectory(walkedPath):
+				return set()
+			for subdirectory in sourceDirectory.iterDirectories(walkedPath):
+				self._addDirectory(sourceDirectory,subdirectory)
+			changed = set(sourceDirectory.iterFiles(walkedPath,verbose=False))
+			for filename in changed:
+				self.files[os.path.normpath(filename)] = filename
+			return changed
+
+		if path in self.sourceDirectories:
+			return self._removeDirectory(path)
+
+		if sourceDirectory.isSourceFile(walkedPath):
+			self.files[path] = walkedPath
+			return set([walkedPath])
+		return set()
+
+	def _addDirectory(self,sourceDirectory,directory):
+		self.sourceDirectories[os.path.normpath(directory)] = (sourceDirectory,directory)
+		self.directories.add(os.path.normpath(directory))
+
+	def _removeDirectory(self,directory):
+		'''
+		Stop watching directory and everything below it. Return the files we knew there
+		'''
+		prefix = directory+os.sep
+		for path in list(self.directories):
+			if path == directory or path.startswith(prefix):
+				self.directories.discard(path)
+				self.sourceDirectories.pop(path,None)
+
+		changed = set()
+		for path in list(self.files):
+			if path.startswith(prefix):
+				changed.add(self.files.pop(path))
+		return changed
+
+	def _waitForChanges(self,timeout):
+		'''
+		Return the set of watched paths which changed or None if nothing changed before the timeout
+		'''
+		raise NotImplementedError
+
+	def close(self):
+		pass
+
+
+class InotifyWatcher(Watcher):
+	'''
+	Watch every directory with inotify and filter the events down to the paths we care about
+	'''
+
+	MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+	#struct inotify_event {int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[];}
+	eventHeader = struct.Struct('iIII')
+
+	def __init__(self,files,sourceDirectories,debounce):
+		super(InotifyWatcher,self).__init__(files,sourceDirectories,debounce)
+
+		self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',use_errno=True)
+		self.fd = self.libc.inotify_init()
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(),"inotify_init failed")
+
+		#wd -> directory and back
+		self.watchDescriptors = {}
+		self.watchedDirectories = {}
+		for directory in self.directories:
+			if not self._watch(directory):
+				self.close()
+				raise OSError(ctypes.get_errno(),'Could not watch "%s"'%directory)
+
+	def _watch(self,directory):
+		wd = self.libc.inotify_add_watch(self.fd,directory,self.MASK)
+		if wd < 0:
+			return False
+		self.watchDescriptors[wd] = directory
+		self.watchedDirectories[directory] = wd
+		return True
+
+	def _addDirectory(self,sourceDirectory,directory):
+		super(InotifyWatcher,self)._addDirectory(sourceDirectory,directory)
+		#it might be gone again already. Then there is nothing to watch
+		self._watch(os.path.normpath(directory))
+
+	def _removeDirectory(self,directory):
+		changed = super(InotifyWatcher,self)._removeDirectory(directory)
+		for path,wd in self.watchedDirectories.items():
+			if path not in self.directories:
+				#the kernel drops the watch of a deleted directory by itself but not that of one moved away
+				self.libc.inotify_rm_watch(self.fd,wd)
+				del self.watchedDirectories[path]
+				del self.watchDescriptors[wd]
+		return changed
+
+	def _waitForChanges(self,timeout):
+		deadline = None if timeout is None else time.time()+timeout
+		while True:
+			remaining = None if deadline is None else max(0,deadline-time.time())
+			ready,_,_ = select.select([self.fd],[],[],remaining)
+			if not ready:
+				return None
+
+			changed = self._readEvents(os.read(self.fd,65536))
+			if changed:
+				return changed
+
+	def _readEvents(self,data):
+		changed = set()
+		offset = 0
+		while offset < len(data):
+			wd,mask,cookie,length = self.eventHeader.unpack_from(data,offset)
+			offset += self.eventHeader.size
+			name = data[offset:offset+length].rstrip('\0')
+			offset += length
+
+			if mask & IN_Q_OVERFLOW:
+				#we lost events. Assume everything we know about changed
+				changed.update(self.files.values())
+				continue
+
+			if wd in self.watchDescriptors and name:
+				changed |= self._getChangedPaths(os.path.join(self.watchDescriptors[wd],name))
+		return changed
+
+	def close(self):
+		os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+	'''
+	Stat every watched path every 'interval' seconds and compare
+	'''
+
+	def __init__(self,files,sourceDirectories,debounce,interval):
+		super(PollingWatcher,self).__init__(files,sourceDirectories,debounce)
+		self.roots = sourceDirectories
+		self.interval = interval
+		self.snapshot = self._takeSnapshot()
+
+	def _takeSnapshot(self):
+		'''
+		Return {path: (mtime,size)} for every watched path that exists
+		The source directories are walked again each time, which finds new files and directories anywhere below them
+		'''
+		paths = set(self.files.values())
+		for sourceDirectory in self.roots:
+			#a .gitignore might have changed since the last walk
+			sourceDirectory.forgetGitignores()
+			paths.update(sourceDirectory.iterFiles(verbose=False))
+
+		snapshot = {}
+		for path in paths:
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			snapshot[path] = (stat.st_mtime,stat.st_size)
+		return snapshot
+
+	def _waitForChanges(self,timeout):
+		deadline = None if timeout is None else time.time()+timeout
+		while True:
+			if deadline is None:
+				time.sleep(self.interval)
+			else:
+				remaining = deadline-time.time()
+				if remaining <= 0:
+					return None
+				time.sleep(min(self.interval,remaining))
+
+			snapshot = self._takeSnapshot()
+			changed = set(path for path in set(snapshot)|set(self.snapshot) if snapshot.get(path) != self.snapshot.get(path))
+			self.snapshot = snapshot
+			if changed:
+				return changed